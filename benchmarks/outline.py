@@ -0,0 +1,39 @@
+# アウトライン抽出 (字句解析のみ) と構文解析の処理時間を比較する
+#   python -m benchmarks.outline [--scripts N] [--stmts N] [--repeat N]
+import sys
+import time
+import argparse
+from python3_hsp_tiny_parser.parser import Parser
+from python3_hsp_tiny_parser.outline import outline_str
+from benchmarks.parse_many import make_script
+
+
+def best_of(repeat: int, func) -> float:
+    best = None
+    for __ in range(repeat):
+        t = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--scripts', type=int, default=100)
+    argparser.add_argument('--stmts', type=int, default=50)
+    argparser.add_argument('--repeat', type=int, default=3)
+    args = argparser.parse_args()
+
+    src = ''.join(make_script(i, args.stmts) for i in range(args.scripts))
+    print(f'{sys.version.split()[0]}, {src.count(chr(10))} lines')
+
+    parser = Parser(debug=False)
+    parse_time = best_of(args.repeat, lambda: parser.parse_str(src))
+    outline_time = best_of(args.repeat, lambda: outline_str(src))
+    print(f'  parse:   {parse_time * 1000:8.1f} ms')
+    print(f'  outline: {outline_time * 1000:8.1f} ms  (x{parse_time / outline_time:.2f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# parse_many() のスレッド数ごとの処理時間を計測する
+#   python -m benchmarks.parse_many [--scripts N] [--stmts N] [--repeat N]
+# GIL有効のビルドと、free-threadedビルド (python3.13t など) の両方で実行して比較する
+import sys
+import time
+import argparse
+import sysconfig
+from python3_hsp_tiny_parser.parser import Parser
+from python3_hsp_tiny_parser.batch import parse_many
+
+
+def make_script(seed: int, num_stmts: int) -> str:
+    lines = ['*main']
+    for i in range(num_stmts):
+        lines.append(f'v{i % 10} = (v{(i + seed) % 10} + {i}) * 3 \\ 7 < {seed}')
+        if i % 8 == 7:
+            lines.append(f'mes "line {i}", v{i % 10}, , 1')
+    lines.append('goto *main')
+    return '\n'.join(lines) + '\n'
+
+
+def gil_status() -> str:
+    if not sysconfig.get_config_var('Py_GIL_DISABLED'):
+        return 'GIL build'
+    enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    return f'free-threaded build (GIL {"enabled" if enabled else "disabled"})'
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--scripts', type=int, default=200)
+    argparser.add_argument('--stmts', type=int, default=50)
+    argparser.add_argument('--repeat', type=int, default=3)
+    argparser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = argparser.parse_args()
+
+    sources = [make_script(i, args.stmts) for i in range(args.scripts)]
+    print(f'{sys.version.split()[0]} {gil_status()}, {args.scripts} scripts x {args.stmts} stmts')
+
+    base = None
+    for workers in args.workers:
+        best = None
+        for __ in range(args.repeat):
+            parser = Parser(debug=False)
+            t = time.perf_counter()
+            results = parse_many(sources, max_workers=workers, parser=parser)
+            elapsed = time.perf_counter() - t
+            best = elapsed if best is None else min(best, elapsed)
+        assert all(r.diagnostic is None for r in results)
+        base = base or best
+        print(f'  workers={workers}: {best * 1000:8.1f} ms  (x{base / best:.2f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,15 @@ import sys
 import argparse
 
 from python3_hsp_tiny_parser.tokenizer import TokenizeError
+from .preprocessor import PreprocessError
 from .parser import Parser, ParseError
+from .json_export import write_json, write_ndjson
+from .lint import Linter, format_diagnostic
+from .watch import Watcher
+from .diff import diff_trees, format_change
+from .emitter import EmitError, to_source
+from .transpile import TranspileError
+from .optimize import VerificationError, optimize
 import colorama
 from colorama import Fore, Back, Style
 
@@ -19,22 +27,124 @@ def print_error(*args, **kwargs):
 
 def get_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('srcfile')
+    parser.add_argument('srcfiles', nargs='+', metavar='srcfile')
+    parser.add_argument('--emit', choices=['json', 'ndjson'],
+                        help='write the AST to stdout instead of the debug output')
+    parser.add_argument('--lint', action='store_true',
+                        help='report lint diagnostics')
+    parser.add_argument('--lint-cost', action='store_true',
+                        help='report the time spent in each lint rule (with --lint)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of processes used by --lint')
+    parser.add_argument('--watch', action='store_true',
+                        help='watch files/directories and report new or resolved diagnostics')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='polling interval in seconds (with --watch)')
+    parser.add_argument('--debounce', type=float, default=0.3,
+                        help='seconds without changes before re-parsing (with --watch)')
+    parser.add_argument('--optimize', action='store_true',
+                        help='remove unreachable statements and unused labels, and write the result to stdout')
+    parser.add_argument('--verify', action='store_true',
+                        help='check that the optimized program behaves the same (with --optimize)')
     return parser.parse_args()
 
 
+def lint(args):
+    result = Linter().lint_files(args.srcfiles, jobs=args.jobs)
+    for d in result.diagnostics:
+        print(format_diagnostic(d))
+    if args.lint_cost:
+        for name, cost in sorted(result.costs.items(), key=lambda c: c[1], reverse=True):
+            print(f'{name}: {cost * 1000:.3f} ms', file=sys.stderr)
+
+
+def print_watch_report(new, resolved):
+    for d in resolved:
+        print(Fore.GREEN + '- ' + format_diagnostic(d) + Style.RESET_ALL)
+    for d in new:
+        print(Fore.RED + '+ ' + format_diagnostic(d) + Style.RESET_ALL)
+    sys.stdout.flush()
+
+
+def watch(args):
+    watcher = Watcher(args.srcfiles, report=print_watch_report)
+    try:
+        watcher.run(interval=args.interval, debounce=args.debounce)
+    except KeyboardInterrupt:
+        pass
+
+
+def optimize_files(args):
+    parser = Parser(debug=False)
+    for srcfile in args.srcfiles:
+        try:
+            result = optimize(parser.parse_file(srcfile), verify=args.verify)
+            sys.stdout.write(to_source(result.tree))
+        except (TokenizeError, PreprocessError, ParseError, EmitError, TranspileError, VerificationError) as e:
+            print_error(e)
+            continue
+        print(f'{srcfile}: removed {result.removed_nodes} nodes ({result.removed_stmts} statements), '
+              f'retargeted {result.retargeted} jumps', file=sys.stderr)
+
+
+def diff(argv):
+    parser = argparse.ArgumentParser(prog='python3_hsp_tiny_parser diff')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    args = parser.parse_args(argv)
+
+    hsp_parser = Parser(debug=False)
+    try:
+        old = hsp_parser.parse_file(args.old)
+        new = hsp_parser.parse_file(args.new)
+    except (TokenizeError, PreprocessError, ParseError) as e:
+        print_error(e)
+        return 2
+
+    changes = diff_trees(old, new)
+    for change in changes:
+        print(format_change(change))
+    return 1 if changes else 0
+
+
 def main():
     colorama.init()
 
+    if len(sys.argv) >= 2 and sys.argv[1] == 'diff':
+        sys.exit(diff(sys.argv[2:]))
+
     args = get_args()
 
-    parser = Parser()
-    try:
-        ast = parser.parse_file(args.srcfile)
-    except TokenizeError as e:
-        print_error(e)
-    except ParseError as e:
-        print_error(e)
+    if args.watch:
+        watch(args)
+        return
+
+    if args.lint:
+        lint(args)
+        return
+
+    if args.optimize:
+        optimize_files(args)
+        return
+
+    parser = Parser(debug=args.emit is None)
+    for srcfile in args.srcfiles:
+        try:
+            if args.emit == 'json':
+                ast = parser.parse_file(srcfile)
+                write_json(ast, sys.stdout)
+            elif args.emit == 'ndjson':
+                write_ndjson(parser.iter_file(srcfile), sys.stdout)
+            else:
+                ast = parser.parse_file(srcfile)
+        except TokenizeError as e:
+            print_error(e)
+        except PreprocessError as e:
+            print_error(e)
+        except ParseError as e:
+            print_error(e)
 
 
-main()
+# 並列実行時に子プロセスがmain()を再実行しないようにする
+if __name__ == '__main__':
+    main()
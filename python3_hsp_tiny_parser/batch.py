@@ -0,0 +1,42 @@
+from typing import Iterable, Optional, Union
+from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .parser import Parser
+from .lint import SYNTAX_ERRORS, parse_error_diagnostic
+
+
+# ast: 構文解析に成功した場合のStmtsノード
+# diagnostic: 構文エラーの場合のDiagnostic (成功した場合はNone)
+ParseResult = namedtuple('ParseResult', ['ast', 'diagnostic'])
+
+
+def _source_name(index: int, source: Union[Path, str]):
+    return source if isinstance(source, Path) else f'<source {index}>'
+
+
+def _parse_one(parser: Parser, index: int, source: Union[Path, str]) -> ParseResult:
+    try:
+        if isinstance(source, Path):
+            ast = parser.parse_file(source)
+        else:
+            ast = parser.parse_str(source)
+    except SYNTAX_ERRORS as e:
+        return ParseResult(None, parse_error_diagnostic(_source_name(index, source), e))
+    return ParseResult(ast, None)
+
+
+def parse_many(sources: Iterable[Union[Path, str]], max_workers: Optional[int] = None,
+               parser: Optional[Parser] = None) -> list[ParseResult]:
+    # sources: ソースコードの文字列、またはファイルのPath
+    # 戻り値はsourcesと同じ順に並ぶ
+    # Parserはスレッド間で共有できるので、すべてのスレッドで1つのParser(とIncludeCache)を使う
+    if parser is None:
+        parser = Parser(debug=False)
+
+    sources = list(sources)
+    if max_workers == 1 or len(sources) <= 1:
+        return [_parse_one(parser, i, s) for i, s in enumerate(sources)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_parse_one, [parser] * len(sources), range(len(sources)), sources))
@@ -0,0 +1,327 @@
+from typing import Iterator, Optional, Union
+from .tokenizer import Token
+from .parser import Node
+
+
+NodeType = Node.NodeType
+
+# 制御を移す命令
+JUMP_COMMANDS = frozenset(['goto'])
+CALL_COMMANDS = frozenset(['gosub'])
+RETURN_COMMANDS = frozenset(['return'])
+EXIT_COMMANDS = frozenset(['end', 'stop'])
+BLOCK_END_COMMANDS = JUMP_COMMANDS | CALL_COMMANDS | RETURN_COMMANDS | EXIT_COMMANDS
+
+
+def _command_name(stmt: Node) -> Optional[str]:
+    if stmt.tag == NodeType.CALL_STMT:
+        return stmt.child_nodes[0].value.src.lower()
+
+
+def _jump_target(stmt: Node) -> Optional[Node]:
+    # goto/gosubの第1引数
+    args = stmt.child_nodes[1].child_nodes
+    return args[0] if args else None
+
+
+def _iter_label_literals(node: Node) -> Iterator[Node]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.tag == NodeType.LABEL_LITERAL:
+            yield node
+        else:
+            stack.extend(node.child_nodes)
+
+
+def _iter_var_reads(node: Node) -> Iterator[str]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.tag == NodeType.LABEL_LITERAL:
+            continue
+        if node.tag == NodeType.ATOM:
+            if isinstance(node.value, Token) and node.value.tag == Token.TokenType.ID:
+                yield node.value.src
+        else:
+            stack.extend(node.child_nodes)
+
+
+def stmt_uses(stmt: Node) -> list[str]:
+    if stmt.tag == NodeType.ASSIGN_STMT:
+        return list(_iter_var_reads(stmt.child_nodes[1]))
+    if stmt.tag == NodeType.CALL_STMT:
+        # 命令の引数に渡した変数は参照とみなす
+        return list(_iter_var_reads(stmt.child_nodes[1]))
+    return []
+
+
+def stmt_def(stmt: Node) -> Optional[str]:
+    if stmt.tag == NodeType.ASSIGN_STMT:
+        return stmt.child_nodes[0].value.src
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class BasicBlock():
+
+    def __init__(self, index: int, start: int, end: int):
+        # stmts[start:end] がこのブロックに含まれる
+        self.index = index
+        self.start = start
+        self.end = end
+        self.succs = []
+        self.preds = []
+
+    def __repr__(self) -> str:
+        return f'BasicBlock({self.index}, stmts[{self.start}:{self.end}], succs={self.succs})'
+
+
+class ControlFlowGraph():
+
+    def __init__(self, ast: Node):
+        if ast.tag != NodeType.STMTS:
+            raise ValueError(f'ControlFlowGraph: expected Stmts but got "{ast.tag_str()}"')
+
+        self.ast = ast
+        self.stmts = list(ast.child_nodes)
+        self._stmt_index = {id(s): i for i, s in enumerate(self.stmts)}
+
+        self.blocks = []
+        self.block_of = []
+        self.labels = {}
+        self.entries = []
+
+        self._split_blocks()
+        self._link_blocks()
+
+    def stmt_index(self, stmt: Union[Node, int]) -> int:
+        if isinstance(stmt, int):
+            return stmt
+        return self._stmt_index[id(stmt)]
+
+    def _split_blocks(self):
+        leaders = {0}
+        for i, stmt in enumerate(self.stmts):
+            if stmt.tag == NodeType.LABEL_STMT:
+                leaders.add(i)
+            name = _command_name(stmt)
+            if name in BLOCK_END_COMMANDS:
+                leaders.add(i + 1)
+
+        starts = sorted(i for i in leaders if i < len(self.stmts))
+        for index, start in enumerate(starts):
+            end = starts[index + 1] if index + 1 < len(starts) else len(self.stmts)
+            self.blocks.append(BasicBlock(index, start, end))
+            self.block_of.extend([index] * (end - start))
+
+        for i, stmt in enumerate(self.stmts):
+            if stmt.tag == NodeType.LABEL_STMT:
+                self.labels.setdefault(stmt.child_nodes[0].value.src, self.block_of[i])
+
+    def _link_blocks(self):
+        # ラベルのアドレスが変数や他の命令に渡される場合、
+        # そのラベルはどこからでも(割り込みや間接ジャンプで)実行されうる
+        escaped = set()
+        return_sites = set()
+        for block in self.blocks:
+            for stmt in self.stmts[block.start:block.end]:
+                name = _command_name(stmt)
+                direct = _jump_target(stmt) if name in JUMP_COMMANDS | CALL_COMMANDS else None
+                for lit in _iter_label_literals(stmt):
+                    if lit is not direct:
+                        escaped.add(lit.child_nodes[0].value.src)
+            last = self.stmts[block.end - 1]
+            if _command_name(last) in CALL_COMMANDS and block.index + 1 < len(self.blocks):
+                return_sites.add(block.index + 1)
+
+        escaped_blocks = {self.labels[name] for name in escaped if name in self.labels}
+
+        for block in self.blocks:
+            last = self.stmts[block.end - 1]
+            name = _command_name(last)
+            if name in JUMP_COMMANDS | CALL_COMMANDS:
+                target = _jump_target(last)
+                if target is not None and target.tag == NodeType.LABEL_LITERAL:
+                    label = target.child_nodes[0].value.src
+                    succs = {self.labels[label]} if label in self.labels else set()
+                else:
+                    # 変数経由の間接ジャンプ
+                    succs = set(escaped_blocks)
+            elif name in RETURN_COMMANDS:
+                succs = set(return_sites)
+            elif name in EXIT_COMMANDS:
+                succs = set()
+            else:
+                succs = {block.index + 1} if block.index + 1 < len(self.blocks) else set()
+
+            block.succs = sorted(succs)
+            for s in block.succs:
+                self.blocks[s].preds.append(block.index)
+
+        if self.blocks:
+            self.entries = sorted({0} | escaped_blocks)
+
+
+class Reachability():
+
+    def __init__(self, cfg: ControlFlowGraph):
+        self.cfg = cfg
+        self.bits = 0
+
+        worklist = list(cfg.entries)
+        while worklist:
+            b = worklist.pop()
+            if self.bits >> b & 1:
+                continue
+            self.bits |= 1 << b
+            worklist.extend(cfg.blocks[b].succs)
+
+    def is_reachable(self, stmt: Union[Node, int]) -> bool:
+        return bool(self.bits >> self.cfg.block_of[self.cfg.stmt_index(stmt)] & 1)
+
+    def unreachable_stmts(self) -> list[int]:
+        return [i for i, b in enumerate(self.cfg.block_of) if not self.bits >> b & 1]
+
+
+class LiveVariables():
+
+    def __init__(self, cfg: ControlFlowGraph):
+        self.cfg = cfg
+        self.vars = []
+        self.var_index = {}
+
+        nblocks = len(cfg.blocks)
+        self.use = [0] * nblocks
+        self.defs = [0] * nblocks
+        for block in cfg.blocks:
+            use = 0
+            defs = 0
+            for stmt in reversed(cfg.stmts[block.start:block.end]):
+                if (v := stmt_def(stmt)) is not None:
+                    bit = self._bit(v)
+                    defs |= bit
+                    use &= ~bit
+                for v in stmt_uses(stmt):
+                    use |= self._bit(v)
+            self.use[block.index] = use
+            self.defs[block.index] = defs
+
+        self.live_in_bits = [0] * nblocks
+        self.live_out_bits = [0] * nblocks
+        worklist = list(range(nblocks))
+        pending = [True] * nblocks
+        while worklist:
+            b = worklist.pop()
+            pending[b] = False
+            out = 0
+            for s in cfg.blocks[b].succs:
+                out |= self.live_in_bits[s]
+            self.live_out_bits[b] = out
+            new_in = self.use[b] | (out & ~self.defs[b])
+            if new_in != self.live_in_bits[b]:
+                self.live_in_bits[b] = new_in
+                for p in cfg.blocks[b].preds:
+                    if not pending[p]:
+                        pending[p] = True
+                        worklist.append(p)
+
+    def _bit(self, var: str) -> int:
+        if var not in self.var_index:
+            self.var_index[var] = len(self.vars)
+            self.vars.append(var)
+        return 1 << self.var_index[var]
+
+    def _names(self, bits: int) -> set[str]:
+        return {self.vars[i] for i in iter_bits(bits)}
+
+    def _live_after(self, i: int) -> int:
+        cfg = self.cfg
+        block = cfg.blocks[cfg.block_of[i]]
+        live = self.live_out_bits[block.index]
+        for stmt in reversed(cfg.stmts[i + 1:block.end]):
+            live = self._transfer(stmt, live)
+        return live
+
+    def _transfer(self, stmt: Node, live: int) -> int:
+        if (v := stmt_def(stmt)) is not None:
+            live &= ~(1 << self.var_index[v])
+        for v in stmt_uses(stmt):
+            live |= 1 << self.var_index[v]
+        return live
+
+    def live_out(self, stmt: Union[Node, int]) -> set[str]:
+        return self._names(self._live_after(self.cfg.stmt_index(stmt)))
+
+    def live_in(self, stmt: Union[Node, int]) -> set[str]:
+        i = self.cfg.stmt_index(stmt)
+        return self._names(self._transfer(self.cfg.stmts[i], self._live_after(i)))
+
+
+class ReachingDefinitions():
+
+    def __init__(self, cfg: ControlFlowGraph):
+        self.cfg = cfg
+        # 定義(代入文)の文番号と、変数ごとの定義の集合
+        self.defs = [i for i, s in enumerate(cfg.stmts) if stmt_def(s) is not None]
+        self.def_index = {stmt: d for d, stmt in enumerate(self.defs)}
+        self.defs_of_var = {}
+        for d, i in enumerate(self.defs):
+            v = stmt_def(cfg.stmts[i])
+            self.defs_of_var[v] = self.defs_of_var.get(v, 0) | 1 << d
+
+        nblocks = len(cfg.blocks)
+        self.gen = [0] * nblocks
+        self.kill = [0] * nblocks
+        for block in cfg.blocks:
+            gen = 0
+            kill = 0
+            for i in range(block.start, block.end):
+                if i in self.def_index:
+                    gen, kill = self._transfer_gen_kill(i, gen, kill)
+            self.gen[block.index] = gen
+            self.kill[block.index] = kill
+
+        self.in_bits = [0] * nblocks
+        self.out_bits = [0] * nblocks
+        worklist = list(reversed(range(nblocks)))
+        pending = [True] * nblocks
+        while worklist:
+            b = worklist.pop()
+            pending[b] = False
+            in_ = 0
+            for p in cfg.blocks[b].preds:
+                in_ |= self.out_bits[p]
+            self.in_bits[b] = in_
+            new_out = self.gen[b] | (in_ & ~self.kill[b])
+            if new_out != self.out_bits[b]:
+                self.out_bits[b] = new_out
+                for s in cfg.blocks[b].succs:
+                    if not pending[s]:
+                        pending[s] = True
+                        worklist.append(s)
+
+    def _transfer_gen_kill(self, i: int, gen: int, kill: int):
+        d = 1 << self.def_index[i]
+        others = self.defs_of_var[stmt_def(self.cfg.stmts[i])] & ~d
+        return (gen & ~others) | d, kill | others
+
+    def reaching(self, stmt: Union[Node, int]) -> list[int]:
+        # stmtの直前に到達する定義(代入文の文番号)
+        cfg = self.cfg
+        i = cfg.stmt_index(stmt)
+        block = cfg.blocks[cfg.block_of[i]]
+        bits = self.in_bits[block.index]
+        for j in range(block.start, i):
+            if j in self.def_index:
+                d = 1 << self.def_index[j]
+                bits = (bits & ~self.defs_of_var[stmt_def(cfg.stmts[j])]) | d
+        return [self.defs[d] for d in iter_bits(bits)]
+
+    def reaching_var(self, stmt: Union[Node, int], var: str) -> list[int]:
+        return [i for i in self.reaching(stmt) if stmt_def(self.cfg.stmts[i]) == var]
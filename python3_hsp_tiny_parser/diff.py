@@ -0,0 +1,194 @@
+import io
+from bisect import bisect_left
+from typing import Optional
+from collections import namedtuple
+from .tokenizer import TokenPosition, position_key
+from .parser import Node
+from .emitter import EmitError, Emitter
+
+
+NodeType = Node.NodeType
+
+INSERT = 'insert'
+DELETE = 'delete'
+MOVE = 'move'
+MODIFY = 'modify'
+
+# old/new: 文または式のノード (挿入ならoldが、削除ならnewがNone)
+# details: 変更された文の中で、実際に変わった部分式の変更
+Change = namedtuple('Change', ['kind', 'old', 'new', 'old_pos', 'new_pos', 'details'])
+
+
+def _pos(node: Optional[Node]) -> Optional[TokenPosition]:
+    if node is not None and (tok := node.first_token()):
+        return tok.pos
+
+
+def _change(kind: str, old: Optional[Node], new: Optional[Node], details=()) -> Change:
+    return Change(kind, old, new, _pos(old), _pos(new), tuple(details))
+
+
+def _lis(pairs: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    # pairsはiの昇順。jが増加する最長部分列を求める (patience sorting)
+    tails = []
+    tail_index = []
+    prev = [None] * len(pairs)
+    for k, (__, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+        prev[k] = tail_index[pos - 1] if pos > 0 else None
+
+    result = []
+    k = tail_index[-1] if tail_index else None
+    while k is not None:
+        result.append(pairs[k])
+        k = prev[k]
+    result.reverse()
+    return result
+
+
+def match_stmts(a: list[Node], b: list[Node]) -> list[tuple[int, int]]:
+    # 変更のない文の対応 (i, j) を、両方で一意な文を手がかりに求める (patience diff)
+    matches = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        # 範囲内で一意な文の位置 (重複していればNone)
+        unique_a = {}
+        for i in range(alo, ahi):
+            h = a[i].hash_value
+            unique_a[h] = i if h not in unique_a else None
+        unique_b = {}
+        for j in range(blo, bhi):
+            h = b[j].hash_value
+            unique_b[h] = j if h not in unique_b else None
+        pairs = sorted((i, unique_b[h]) for h, i in unique_a.items()
+                       if i is not None and unique_b.get(h) is not None and a[i] == b[unique_b[h]])
+
+        anchors = _lis(pairs)
+        if not anchors:
+            continue
+
+        matches.extend(anchors)
+        bounds = [(alo - 1, blo - 1), *anchors, (ahi, bhi)]
+        for (i0, j0), (i1, j1) in zip(bounds, bounds[1:]):
+            if i0 + 1 < i1 and j0 + 1 < j1:
+                stack.append((i0 + 1, i1, j0 + 1, j1))
+
+    matches.sort()
+    return matches
+
+
+def _stmt_key(stmt: Node):
+    # 同じ文の変更とみなす手がかり: 文の種類と、代入先/命令名/ラベル名
+    tok = stmt.child_nodes[0].value if stmt.child_nodes else None
+    return (stmt.tag, getattr(tok, 'src', None))
+
+
+def diff_nodes(a: Node, b: Node) -> list[Change]:
+    # 異なる部分木のうち、できるだけ深いものを変更として報告する
+    if a == b:
+        return []
+    if a.tag != b.tag or a.tag == NodeType.ATOM or len(a.child_nodes) != len(b.child_nodes):
+        return [_change(MODIFY, a, b)]
+
+    changes = []
+    for ca, cb in zip(a.child_nodes, b.child_nodes):
+        changes.extend(diff_nodes(ca, cb))
+    return changes
+
+
+def diff_trees(old: Node, new: Node) -> list[Change]:
+    a = list(old.child_nodes)
+    b = list(new.child_nodes)
+    matches = match_stmts(a, b)
+
+    changes = []
+    deleted = []
+    inserted = []
+
+    bounds = [(-1, -1), *matches, (len(a), len(b))]
+    for (i0, j0), (i1, j1) in zip(bounds, bounds[1:]):
+        # 対応の間にある文は、同じ手がかりを持つものを変更された文とみなす
+        candidates = {}
+        for j in range(j0 + 1, j1):
+            candidates.setdefault(_stmt_key(b[j]), []).append(j)
+        paired = set()
+        for i in range(i0 + 1, i1):
+            if js := candidates.get(_stmt_key(a[i])):
+                j = js.pop(0)
+                paired.add(j)
+                changes.append(_change(MODIFY, a[i], b[j], diff_nodes(a[i], b[j])))
+            else:
+                deleted.append(i)
+        inserted.extend(j for j in range(j0 + 1, j1) if j not in paired)
+
+    # 削除と挿入の両方に現れる同じ文は移動とみなす
+    inserted_by_hash = {}
+    for j in inserted:
+        inserted_by_hash.setdefault(b[j].hash_value, []).append(j)
+    moved = set()
+    for i in deleted:
+        js = [j for j in inserted_by_hash.get(a[i].hash_value, []) if j not in moved and a[i] == b[j]]
+        if js:
+            moved.add(js[0])
+            changes.append(_change(MOVE, a[i], b[js[0]]))
+        else:
+            changes.append(_change(DELETE, a[i], None))
+    changes.extend(_change(INSERT, None, b[j]) for j in inserted if j not in moved)
+
+    changes.sort(key=lambda c: (position_key(c.new_pos or c.old_pos), position_key(c.old_pos)))
+    return changes
+
+
+def _source(node: Node) -> str:
+    stream = io.StringIO()
+    try:
+        if node.tag in (NodeType.LABEL_STMT, NodeType.ASSIGN_STMT, NodeType.CALL_STMT):
+            Emitter(stream).emit_stmt(node)
+        else:
+            Emitter(stream).emit_expr(node)
+    except EmitError:
+        return repr(node)
+    return stream.getvalue().rstrip('\n')
+
+
+def _format_pos(pos: Optional[TokenPosition]) -> str:
+    if pos is None:
+        return '?'
+    if pos.srcfile is not None:
+        return f'{pos.srcfile}:{pos.row}:{pos.column}'
+    return f'{pos.row}:{pos.column}'
+
+
+def format_change(change: Change) -> str:
+    if change.kind == INSERT:
+        return f'+ {_format_pos(change.new_pos)}: {_source(change.new)}'
+    elif change.kind == DELETE:
+        return f'- {_format_pos(change.old_pos)}: {_source(change.old)}'
+    elif change.kind == MOVE:
+        return f'> {_format_pos(change.old_pos)} -> {_format_pos(change.new_pos)}: {_source(change.new)}'
+    else:
+        lines = [f'~ {_format_pos(change.old_pos)} -> {_format_pos(change.new_pos)}: '
+                 f'{_source(change.old)}  =>  {_source(change.new)}']
+        for d in change.details:
+            lines.append(f'    {_format_pos(d.old_pos)} -> {_format_pos(d.new_pos)}: '
+                         f'{_source(d.old)}  =>  {_source(d.new)}')
+        return '\n'.join(lines)
@@ -0,0 +1,71 @@
+from typing import Iterable, Optional
+from collections import namedtuple
+from .tokenizer import TokenPosition
+from .parser import Node
+
+
+NodeType = Node.NodeType
+
+# 重複検出の対象外とするノード (文・式以外)
+IGNORED_TAGS = frozenset([
+    NodeType.STMTS,
+    NodeType.EMPTY_STMT,
+    NodeType.ARGS,
+    NodeType.DEFAULT,
+    NodeType.ATOM,
+])
+
+Location = namedtuple('Location', ['srcfile', 'pos', 'node'])
+
+
+def iter_subtrees(node: Node) -> Iterable[Node]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.child_nodes))
+
+
+def find_duplicates(trees: Iterable[tuple], min_size: int = 3) -> list[list[Location]]:
+    # trees: (srcfile, ast) の並び
+    # 戻り値: 同一構造の文・式の位置のリスト (部分木の大きい順)
+    buckets = {}
+    for srcfile, ast in trees:
+        for node in iter_subtrees(ast):
+            if node.tag in IGNORED_TAGS or node.size < min_size:
+                continue
+            buckets.setdefault(node.hash_value, []).append((srcfile, node))
+
+    groups = []
+    for candidates in buckets.values():
+        if len(candidates) < 2:
+            continue
+        # ハッシュの衝突に備えて、同一バケット内は実際に比較して分類する
+        classes = []
+        for srcfile, node in candidates:
+            for c in classes:
+                if c[0][1] == node:
+                    c.append((srcfile, node))
+                    break
+            else:
+                classes.append([(srcfile, node)])
+        groups.extend(c for c in classes if len(c) >= 2)
+
+    groups.sort(key=lambda c: c[0][1].size, reverse=True)
+
+    # 重複した部分木の内側にある重複は報告しない
+    covered = set()
+    result = []
+    for group in groups:
+        if all(id(node) in covered for __, node in group):
+            continue
+        for __, node in group:
+            covered.update(id(n) for n in iter_subtrees(node))
+        result.append([Location(srcfile, _pos(node), node) for srcfile, node in group])
+
+    return result
+
+
+def _pos(node: Node) -> Optional[TokenPosition]:
+    if tok := node.first_token():
+        return tok.pos
@@ -0,0 +1,127 @@
+import io
+from typing import TextIO
+from .tokenizer import Token
+from .parser import Node
+
+
+NodeType = Node.NodeType
+
+# 二項演算子の優先順位 (大きいほど強く結合する)
+PRECEDENCE = {
+    NodeType.EQ_EXPR: 1,
+    NodeType.NEQ_EXPR: 1,
+    NodeType.LT_EXPR: 1,
+    NodeType.LTEQ_EXPR: 1,
+    NodeType.GT_EXPR: 1,
+    NodeType.GTEQ_EXPR: 1,
+    NodeType.ADD_EXPR: 2,
+    NodeType.SUB_EXPR: 2,
+    NodeType.MUL_EXPR: 3,
+    NodeType.DIV_EXPR: 3,
+    NodeType.MOD_EXPR: 3,
+}
+
+
+class EmitError(Exception):
+    pass
+
+
+class Emitter():
+
+    def __init__(self, stream: TextIO, indent: str = ''):
+        self.stream = stream
+        self.indent = indent
+
+    def emit(self, node: Node):
+        if node.tag == NodeType.STMTS:
+            for stmt in node.child_nodes:
+                self.emit_stmt(stmt)
+        else:
+            self.emit_stmt(node)
+
+    def emit_stmt(self, node: Node):
+        write = self.stream.write
+
+        if node.tag == NodeType.EMPTY_STMT:
+            pass
+        elif node.tag == NodeType.LABEL_STMT:
+            write('*')
+            self._write_atom(node.child_nodes[0])
+        elif node.tag == NodeType.ASSIGN_STMT:
+            target, expr = node.child_nodes
+            write(self.indent)
+            self._write_atom(target)
+            write(' = ')
+            self.emit_expr(expr)
+        elif node.tag == NodeType.CALL_STMT:
+            func, args = node.child_nodes
+            if [a.tag for a in args.child_nodes] == [NodeType.DEFAULT]:
+                raise EmitError('emit_stmt: a single omitted argument cannot be written')
+            write(self.indent)
+            self._write_atom(func)
+            if args.child_nodes:
+                write(' ')
+                for i, arg in enumerate(args.child_nodes):
+                    if i > 0:
+                        write(', ' if arg.tag != NodeType.DEFAULT else ',')
+                    if arg.tag != NodeType.DEFAULT:
+                        self.emit_expr(arg)
+        else:
+            raise EmitError(f'emit_stmt: unexpected node "{node.tag_str()}"')
+
+        write('\n')
+
+    def emit_expr(self, node: Node):
+        # ラベルリテラルは式全体としてのみ書ける (二項演算子の被演算子にはなれない)
+        if node.tag == NodeType.LABEL_LITERAL:
+            self.stream.write('*')
+            self._write_atom(node.child_nodes[0])
+        else:
+            self._write_expr(node, 0)
+
+    def _write_expr(self, node: Node, min_prec: int):
+        if node.tag == NodeType.EXPR:
+            return self._write_expr(node.child_nodes[0], min_prec)
+
+        if node.tag == NodeType.ATOM:
+            return self._write_atom(node)
+
+        if node.tag not in PRECEDENCE:
+            raise EmitError(f'emit_expr: unexpected node "{node.tag_str()}"')
+
+        prec = PRECEDENCE[node.tag]
+        lhs, rhs = node.child_nodes
+
+        paren = prec < min_prec
+        if paren:
+            self.stream.write('(')
+        # 左結合なので、右辺の同じ優先順位の演算子には括弧が必要
+        self._write_expr(lhs, prec)
+        self.stream.write(f' {node.tag_str()} ')
+        self._write_expr(rhs, prec + 1)
+        if paren:
+            self.stream.write(')')
+
+    def _write_atom(self, node: Node):
+        if node.tag != NodeType.ATOM:
+            raise EmitError(f'emit: expected Atom but got "{node.tag_str()}"')
+
+        value = node.value
+        if isinstance(value, Token):
+            if value.tag == Token.TokenType.STR:
+                # トークンの文字列はエスケープシーケンスを含んだまま保持されている
+                self.stream.write(f'"{value.src}"')
+            else:
+                self.stream.write(value.src)
+        else:
+            self.stream.write(str(value))
+
+
+def emit(node: Node, stream: TextIO, indent: str = ''):
+    Emitter(stream, indent).emit(node)
+
+
+def to_source(node: Node, indent: str = '') -> str:
+    stream = io.StringIO()
+    emit(node, stream, indent)
+    return stream.getvalue()
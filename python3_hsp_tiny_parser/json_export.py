@@ -0,0 +1,60 @@
+import json
+from typing import Iterable, TextIO
+from .tokenizer import Token
+from .parser import Node
+
+
+# 出力形式
+#   ノード:   {"tag": "Call", "type": "CALL_STMT", "children": [...]}
+#   Atom:     {"tag": "Atom", "type": "ATOM", "token": {"kind": "ID", "src": "mes", "row": 1, "column": 1}}
+#   インクルードされたファイルのトークンには "srcfile": "b.as" が付く
+# 中間のdictを作らずに、ストリームへ直接書き出す
+
+
+def _write_token(tok: Token, stream: TextIO):
+    stream.write('{"kind":')
+    stream.write(json.dumps(tok.tag.name))
+    stream.write(',"src":')
+    stream.write(json.dumps(tok.src, ensure_ascii=False))
+    stream.write(f',"row":{tok.pos.row},"column":{tok.pos.column}')
+    if tok.pos.srcfile is not None:
+        stream.write(',"srcfile":')
+        stream.write(json.dumps(str(tok.pos.srcfile), ensure_ascii=False))
+    stream.write('}')
+
+
+def write_node(node: Node, stream: TextIO):
+    stream.write('{"tag":')
+    stream.write(json.dumps(node.tag_str()))
+    stream.write(',"type":')
+    stream.write(json.dumps(node.tag.name))
+
+    if node.tag == Node.NodeType.ATOM:
+        if isinstance(node.value, Token):
+            stream.write(',"token":')
+            _write_token(node.value, stream)
+        else:
+            stream.write(',"value":')
+            stream.write(json.dumps(node.value, ensure_ascii=False))
+    else:
+        stream.write(',"children":[')
+        for i, child in enumerate(node.child_nodes):
+            if i > 0:
+                stream.write(',')
+            write_node(child, stream)
+        stream.write(']')
+
+    stream.write('}')
+
+
+def write_json(node: Node, stream: TextIO):
+    write_node(node, stream)
+    stream.write('\n')
+
+
+def write_ndjson(stmts: Iterable[Node], stream: TextIO):
+    # 文を1行に1つずつ書き出す
+    # Parser.iter_file()と組み合わせると、ファイル全体を読み込まずに構文解析しながら出力できる
+    for stmt in stmts:
+        write_node(stmt, stream)
+        stream.write('\n')
@@ -0,0 +1,215 @@
+import time
+from typing import Iterable, Optional, Union
+from pathlib import Path
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from .tokenizer import Token, TokenPosition, TokenizeError, position_key
+from .preprocessor import PreprocessError
+from .parser import Node, Parser, ParseError
+
+
+NodeType = Node.NodeType
+
+Diagnostic = namedtuple('Diagnostic', ['srcfile', 'pos', 'rule', 'message'])
+
+LintResult = namedtuple('LintResult', ['diagnostics', 'costs'])
+
+PARSE_ERROR_RULE = 'parse-error'
+
+SYNTAX_ERRORS = (TokenizeError, PreprocessError, ParseError)
+
+
+def format_diagnostic(d: Diagnostic) -> str:
+    if d.pos is None:
+        return f'{d.srcfile}: {d.rule}: {d.message}'
+    # インクルードされたファイル内の位置は、そのファイルのパスで表示する
+    srcfile = d.pos.srcfile if d.pos.srcfile is not None else d.srcfile
+    return f'{srcfile}:{d.pos.row}:{d.pos.column}: {d.rule}: {d.message}'
+
+
+def parse_error_diagnostic(srcfile, e: Exception) -> Diagnostic:
+    return Diagnostic(srcfile, None, PARSE_ERROR_RULE, f'{type(e).__name__}: {e}')
+
+
+def _id_of(node: Node) -> Optional[Token]:
+    if node.tag == NodeType.ATOM and isinstance(node.value, Token) and node.value.tag == Token.TokenType.ID:
+        return node.value
+
+
+class Rule():
+
+    # ルール名と、visit()を呼び出してほしいノードのタグ
+    # ルールはファイルごとにインスタンス化されるので、状態をselfに持ってよい
+    name = None
+    tags = ()
+
+    def __init__(self, srcfile):
+        self.srcfile = srcfile
+        self.diagnostics = []
+
+    def report(self, pos: Optional[TokenPosition], message: str):
+        self.diagnostics.append(Diagnostic(self.srcfile, pos, self.name, message))
+
+    def visit(self, node: Node, parent: Optional[Node]):
+        pass
+
+    def finish(self):
+        pass
+
+
+class UndefinedLabelRule(Rule):
+
+    name = 'undefined-label'
+    tags = (NodeType.LABEL_STMT, NodeType.LABEL_LITERAL)
+
+    def __init__(self, srcfile):
+        super().__init__(srcfile)
+        self.defined = set()
+        self.referenced = []
+
+    def visit(self, node: Node, parent: Optional[Node]):
+        tok = node.child_nodes[0].value
+        if node.tag == NodeType.LABEL_STMT:
+            self.defined.add(tok.src)
+        else:
+            self.referenced.append(tok)
+
+    def finish(self):
+        for tok in self.referenced:
+            if tok.src not in self.defined:
+                self.report(tok.pos, f'label "*{tok.src}" is not defined')
+
+
+class UnusedVariableRule(Rule):
+
+    name = 'unused-variable'
+    tags = (NodeType.ATOM,)
+
+    # Atomが変数の参照ではない位置
+    NOT_READ_PARENT_TAGS = frozenset([NodeType.CALL_STMT, NodeType.LABEL_STMT, NodeType.LABEL_LITERAL])
+
+    def __init__(self, srcfile):
+        super().__init__(srcfile)
+        self.assigned = {}
+        self.read = set()
+
+    def visit(self, node: Node, parent: Optional[Node]):
+        if (tok := _id_of(node)) is None or parent is None:
+            return
+
+        if parent.tag == NodeType.ASSIGN_STMT and parent.child_nodes[0] is node:
+            self.assigned.setdefault(tok.src, tok)
+        elif parent.tag not in self.NOT_READ_PARENT_TAGS:
+            # 命令の引数に渡した変数は、命令が読み書きするので参照とみなす
+            self.read.add(tok.src)
+
+    def finish(self):
+        for name, tok in self.assigned.items():
+            if name not in self.read:
+                self.report(tok.pos, f'variable "{name}" is assigned but never read')
+
+
+class TooManyDefaultsRule(Rule):
+
+    name = 'too-many-defaults'
+    tags = (NodeType.CALL_STMT,)
+
+    max_defaults = 2
+
+    def visit(self, node: Node, parent: Optional[Node]):
+        func, args = node.child_nodes
+        num_defaults = sum(1 for a in args.child_nodes if a.tag == NodeType.DEFAULT)
+        if num_defaults == 0:
+            return
+
+        if num_defaults == len(args.child_nodes):
+            self.report(func.value.pos, f'all arguments of "{func.value.src}" are omitted')
+        elif num_defaults > self.max_defaults:
+            self.report(func.value.pos, f'{num_defaults} arguments of "{func.value.src}" are omitted')
+
+
+class DivisionByZeroRule(Rule):
+
+    name = 'division-by-zero'
+    tags = (NodeType.DIV_EXPR, NodeType.MOD_EXPR)
+
+    def visit(self, node: Node, parent: Optional[Node]):
+        rhs = node.child_nodes[1]
+        if rhs.tag == NodeType.ATOM and isinstance(rhs.value, Token) \
+                and rhs.value.tag == Token.TokenType.INT and int(rhs.value.src) == 0:
+            op = 'division' if node.tag == NodeType.DIV_EXPR else 'modulo'
+            self.report(rhs.value.pos, f'integer {op} by zero')
+
+
+DEFAULT_RULES = (
+    UndefinedLabelRule,
+    UnusedVariableRule,
+    TooManyDefaultsRule,
+    DivisionByZeroRule,
+)
+
+
+class Linter():
+
+    def __init__(self, rules: Iterable[type] = DEFAULT_RULES):
+        self.rules = tuple(rules)
+
+    def lint_tree(self, ast: Node, srcfile=None) -> LintResult:
+        rules = [rule(srcfile) for rule in self.rules]
+        costs = {rule.name: 0.0 for rule in rules}
+
+        # タグ -> そのタグに関心のあるルールのvisit()
+        dispatch = {}
+        for rule in rules:
+            for tag in rule.tags:
+                dispatch.setdefault(tag, []).append(rule)
+
+        # 全ルールをまとめて1回の走査で実行する
+        clock = time.perf_counter
+        stack = [(ast, None)]
+        while stack:
+            node, parent = stack.pop()
+            for rule in dispatch.get(node.tag, ()):
+                t = clock()
+                rule.visit(node, parent)
+                costs[rule.name] += clock() - t
+            stack.extend((child, node) for child in reversed(node.child_nodes))
+
+        diagnostics = []
+        for rule in rules:
+            t = clock()
+            rule.finish()
+            costs[rule.name] += clock() - t
+            diagnostics.extend(rule.diagnostics)
+
+        diagnostics.sort(key=lambda d: position_key(d.pos))
+        return LintResult(diagnostics, costs)
+
+    def lint_file(self, srcfile: Union[Path, str], parser: Optional[Parser] = None) -> LintResult:
+        if parser is None:
+            parser = Parser(debug=False)
+
+        try:
+            ast = parser.parse_file(srcfile)
+        except SYNTAX_ERRORS as e:
+            return LintResult([parse_error_diagnostic(srcfile, e)], {rule.name: 0.0 for rule in self.rules})
+
+        return self.lint_tree(ast, srcfile)
+
+    def lint_files(self, srcfiles: Iterable[Union[Path, str]], jobs: int = 1) -> LintResult:
+        srcfiles = list(srcfiles)
+        if jobs == 1 or len(srcfiles) <= 1:
+            parser = Parser(debug=False)
+            results = [self.lint_file(f, parser) for f in srcfiles]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(self.lint_file, srcfiles))
+
+        diagnostics = []
+        costs = {rule.name: 0.0 for rule in self.rules}
+        for result in results:
+            diagnostics.extend(result.diagnostics)
+            for name, cost in result.costs.items():
+                costs[name] += cost
+
+        return LintResult(diagnostics, costs)
@@ -0,0 +1,173 @@
+from typing import Optional
+from collections import namedtuple
+from .tokenizer import Token
+from .parser import Node
+from .cfg import CALL_COMMANDS, JUMP_COMMANDS, ControlFlowGraph, Reachability
+from .transpile import ExecutionLimitError, compile_tree
+
+
+NodeType = Node.NodeType
+
+# removed_nodes: 削除されたノード数 (最適化前後のノード数の差)
+# removed_stmts: 削除された文の数
+# retargeted: 飛び先を付け替えたラベル参照の数
+OptimizeResult = namedtuple('OptimizeResult', ['tree', 'removed_nodes', 'removed_stmts', 'retargeted'])
+
+# trace: 呼び出された命令と引数の並び
+# error: 実行時エラー (型名, メッセージ)
+# finished: max_steps以内に終了したか
+Behavior = namedtuple('Behavior', ['trace', 'variables', 'error', 'finished'])
+
+
+class VerificationError(Exception):
+    pass
+
+
+def _direct_target(stmt: Node, commands: frozenset) -> Optional[Node]:
+    # `goto *label` / `gosub *label` のラベル参照
+    if stmt.tag != NodeType.CALL_STMT or stmt.child_nodes[0].value.src.lower() not in commands:
+        return
+    args = stmt.child_nodes[1].child_nodes
+    if len(args) == 1 and args[0].tag == NodeType.LABEL_LITERAL:
+        return args[0]
+
+
+def _label_name(node: Node) -> str:
+    return node.child_nodes[0].value.src
+
+
+def _iter_label_references(node: Node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.tag == NodeType.LABEL_LITERAL:
+            yield _label_name(node)
+        else:
+            stack.extend(node.child_nodes)
+
+
+def _thread_jumps(stmts: list[Node]) -> tuple[list[Node], int]:
+    # ラベルの直後(ラベル定義のみを挟んでもよい)が `goto *b` なら、そのラベルへのジャンプは *b へのジャンプと同じ
+    first_def = {}
+    for i, stmt in enumerate(stmts):
+        if stmt.tag == NodeType.LABEL_STMT:
+            first_def.setdefault(_label_name(stmt), i)
+
+    def next_jump(name: str) -> Optional[str]:
+        i = first_def.get(name)
+        if i is None:
+            return
+        i += 1
+        while i < len(stmts) and stmts[i].tag == NodeType.LABEL_STMT:
+            i += 1
+        if i < len(stmts) and (target := _direct_target(stmts[i], JUMP_COMMANDS)) is not None:
+            return _label_name(target)
+
+    def final(name: str) -> str:
+        seen = [name]
+        while (name := next_jump(name)) is not None:
+            if name in seen:
+                # 無限ループになるジャンプの連鎖は付け替えない
+                return seen[0]
+            seen.append(name)
+        return seen[-1]
+
+    result = []
+    retargeted = 0
+    for stmt in stmts:
+        target = _direct_target(stmt, JUMP_COMMANDS | CALL_COMMANDS)
+        if target is not None and (name := final(_label_name(target))) != _label_name(target):
+            # 位置は参照元のものを使う
+            tok = target.child_nodes[0].value
+            func, args = stmt.child_nodes
+            label = Node.LabelLiteral(Node.Atom(value=Token.Id(tok.pos, name)))
+            stmt = Node.CallStmt(func, Node.Args(label))
+            retargeted += 1
+        result.append(stmt)
+    return result, retargeted
+
+
+def _remove_unreachable(stmts: list[Node]) -> list[Node]:
+    # 開始位置と、値として参照されているラベル(間接ジャンプや割り込みの飛び先)から到達できない文を削除する
+    if not stmts:
+        return stmts
+    reachability = Reachability(ControlFlowGraph(Node.Stmts(*stmts)))
+    unreachable = set(reachability.unreachable_stmts())
+    return [s for i, s in enumerate(stmts) if i not in unreachable]
+
+
+def _remove_unreferenced_labels(stmts: list[Node]) -> list[Node]:
+    referenced = set()
+    for stmt in stmts:
+        if stmt.tag != NodeType.LABEL_STMT:
+            referenced.update(_iter_label_references(stmt))
+    return [s for s in stmts if s.tag != NodeType.LABEL_STMT or _label_name(s) in referenced]
+
+
+def optimize(tree: Node, verify: bool = False, max_steps: int = 100000) -> OptimizeResult:
+    # 変更がなくなるまで、ジャンプの連鎖の付け替え・到達不能な文の削除・未参照のラベルの削除を繰り返す
+    # verify=Trueなら、最適化前後の木を実行して動作が変わらないことを確認する (verify_equivalentを参照)
+    if tree.tag != NodeType.STMTS:
+        raise ValueError(f'optimize: expected Stmts but got "{tree.tag_str()}"')
+
+    stmts = list(tree.child_nodes)
+    retargeted = 0
+    while True:
+        stmts, n = _thread_jumps(stmts)
+        retargeted += n
+        num_stmts = len(stmts)
+        stmts = _remove_unreachable(stmts)
+        stmts = _remove_unreferenced_labels(stmts)
+        if n == 0 and len(stmts) == num_stmts:
+            break
+
+    optimized = Node.Stmts(*stmts)
+    if verify:
+        verify_equivalent(tree, optimized, max_steps)
+
+    return OptimizeResult(optimized, tree.size - optimized.size,
+                          len(tree.child_nodes) - len(stmts), retargeted)
+
+
+def run_behavior(tree: Node, max_steps: int = 100000) -> Behavior:
+    # 命令の呼び出しをすべて記録しながら実行する
+    program = compile_tree(tree)
+    trace = []
+
+    def recorder(name):
+        return lambda *args: trace.append((name, args))
+
+    commands = {name: recorder(name) for name in program.commands}
+    variables = {}
+    error = None
+    finished = True
+    try:
+        variables = program.run(commands, max_steps=max_steps)
+    except ExecutionLimitError:
+        finished = False
+    except Exception as e:
+        error = (type(e).__name__, str(e))
+    return Behavior(trace, variables, error, finished)
+
+
+def verify_equivalent(original: Node, optimized: Node, max_steps: int = 100000):
+    # 最適化後の木は、同じ動作をより少ない(または同じ)ステップ数で実行する
+    # 元の木がmax_steps以内に終了すれば、命令の呼び出し・終了時の変数・実行時エラーが一致すること
+    # 終了しなければ、元の木の命令の呼び出しが最適化後の木の命令の呼び出しの先頭と一致すること
+    expected = run_behavior(original, max_steps)
+    actual = run_behavior(optimized, max_steps)
+
+    if expected.finished:
+        if not actual.finished:
+            raise VerificationError(f'optimized program did not finish in {max_steps} steps')
+        if expected.trace != actual.trace:
+            raise VerificationError(f'trace differs: {expected.trace!r} != {actual.trace!r}')
+        if expected.error != actual.error:
+            raise VerificationError(f'error differs: {expected.error!r} != {actual.error!r}')
+        # 削除された文にだけ現れる変数は、元の木でも初期値(0)のまま
+        for name in expected.variables.keys() | actual.variables.keys():
+            if expected.variables.get(name, 0) != actual.variables.get(name, 0):
+                raise VerificationError(f'variable "{name}" differs: '
+                                        f'{expected.variables.get(name, 0)!r} != {actual.variables.get(name, 0)!r}')
+    elif actual.trace[:len(expected.trace)] != expected.trace:
+        raise VerificationError(f'trace differs: {expected.trace!r} is not a prefix of {actual.trace!r}')
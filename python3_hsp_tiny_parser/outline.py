@@ -0,0 +1,182 @@
+import re
+from typing import Iterable, Iterator, Optional, Union
+from pathlib import Path
+from collections import namedtuple
+from .tokenizer import ID_PATTERN, TokenPosition, Token, TokenizeError, Tokenizer, \
+    skip_block_comment, skip_line_comment, skip_str
+from .preprocessor import SRC_ENCODING
+
+
+LABEL = 'label'
+ASSIGN = 'assign'
+COMMAND = 'command'
+
+# kind: LABEL, ASSIGN, COMMAND
+# name: ラベル名(*を除く)、代入先の変数名、命令名
+# pos: 名前のトークンの位置 (構文解析結果のAtomの位置と同じ)
+OutlineEntry = namedtuple('OutlineEntry', ['kind', 'name', 'pos'])
+
+SPACE_PATTERN = re.compile(r'[ \t]*')
+# 行の残りのうち、コメント・文字列・改行を含まない部分
+REST_PATTERN = re.compile(r'[^"/;\n]*')
+
+
+def _skip_block_comment(src: str, i: int, row: int, column_origin: int):
+    # src[i:]は'/*'で始まる。閉じていなければ末尾まで読み飛ばす
+    end = skip_block_comment(src, i)
+    end = len(src) if end < 0 else end
+    if (lines := src.count('\n', i, end)):
+        row += lines
+        column_origin = src.rfind('\n', i, end) + 1
+    return end, row, column_origin
+
+
+def _skip_spaces(src: str, i: int, row: int, column_origin: int):
+    # 空白と範囲コメント
+    while True:
+        i = SPACE_PATTERN.match(src, i).end()
+        if not src.startswith('/*', i):
+            return i, row, column_origin
+        i, row, column_origin = _skip_block_comment(src, i, row, column_origin)
+
+
+def _skip_rest(src: str, i: int, row: int, column_origin: int):
+    # 行の残り(改行まで)を、コメントと文字列を考慮して読み飛ばす
+    n = len(src)
+    while i < n:
+        i = REST_PATTERN.match(src, i).end()
+        if i >= n:
+            break
+        c = src[i]
+        if c == '\n':
+            return i + 1, row + 1, i + 1
+        elif c == ';' or src.startswith('//', i):
+            i = skip_line_comment(src, i)
+        elif c == '"':
+            end = skip_str(src, i)
+            i = n if end < 0 else end
+        elif src.startswith('/*', i):
+            i, row, column_origin = _skip_block_comment(src, i, row, column_origin)
+        else:
+            i += 1
+    return i, row, column_origin
+
+
+def _substitute(tokens: list[Token], symbols: dict) -> list[Token]:
+    out = []
+    for t in tokens:
+        out.extend(symbols[t.src] if t.tag == Token.TokenType.ID and t.src in symbols else [t])
+    return out
+
+
+def _directive(line: str, conds: list, symbols: dict):
+    # Preprocessorと同様に、#ifdef/#ifndef/#else/#endifの条件と#define/#constの名前を追う
+    # 不正な命令は無視する
+    try:
+        tokens = [t for t in Tokenizer().tokenize(line)
+                  if t.tag not in (Token.TokenType.NEWLINE, Token.TokenType.EOF)]
+    except TokenizeError:
+        return
+    if len(tokens) < 2 or tokens[1].tag != Token.TokenType.ID:
+        return
+
+    name, args = tokens[1].src, tokens[2:]
+    if name in ('ifdef', 'ifndef'):
+        symbol = args[0].src if args else None
+        conds.append((symbol in symbols) == (name == 'ifdef'))
+    elif name == 'else':
+        if conds:
+            conds[-1] = not conds[-1]
+    elif name == 'endif':
+        if conds:
+            conds.pop()
+    elif not all(conds):
+        pass
+    elif name in ('define', 'const') and args and args[0].tag == Token.TokenType.ID:
+        symbols[args[0].src] = _substitute(args[1:], symbols)
+
+
+def _symbol_name(name: str, symbols: dict) -> Optional[str]:
+    # 名前を置き換えた結果が1つの名前でなければNone
+    if name not in symbols:
+        return name
+    body = symbols[name]
+    if len(body) == 1 and body[0].tag == Token.TokenType.ID:
+        return body[0].src
+
+
+def _is_assign(src: str, i: int, symbols: dict) -> bool:
+    if src.startswith('=', i):
+        return not src.startswith('==', i)
+    if (m := ID_PATTERN.match(src, i)) and (body := symbols.get(m.group(0))):
+        return body[0].src == '='
+    return False
+
+
+def iter_outline(src: str) -> Iterator[OutlineEntry]:
+    # 各行の先頭だけを見て文の種類を判定し、行の残りは(コメントと文字列を考慮して)読み飛ばす
+    #   *name        ラベル定義
+    #   name = ...   代入
+    #   name ...     命令
+    # コメントと文字列の範囲はTokenizerと同じ関数で求める
+    # プリプロセッサ命令は、条件(#ifdef/#ifndef/#else/#endif)と#define/#constの名前の置き換えのみ扱う
+    # #includeしたファイルは読まないので、その中で定義された名前が関わる場合は構文解析の結果と異なりうる
+    # 構文の正しさは検査しない
+    i = 0
+    n = len(src)
+    row = 1
+    column_origin = 0
+    # 条件の成否のスタックと、#define/#constされた名前 -> 置き換え後のトークン列
+    conds = []
+    symbols = {}
+
+    while i < n:
+        i, row, column_origin = _skip_spaces(src, i, row, column_origin)
+
+        if src.startswith('#', i):
+            start = i
+            i, row, column_origin = _skip_rest(src, i, row, column_origin)
+            _directive(src[start:i], conds, symbols)
+            continue
+
+        if not all(conds):
+            pass
+        elif m := ID_PATTERN.match(src, i):
+            pos = TokenPosition(row, i - column_origin + 1)
+            body = symbols.get(m.group(0))
+            i = m.end()
+            if body is None or (body and body[0].tag == Token.TokenType.ID):
+                name = m.group(0) if body is None else body[0].src
+                if body is not None and len(body) > 1:
+                    assign = body[1].src == '='
+                else:
+                    i, row, column_origin = _skip_spaces(src, i, row, column_origin)
+                    assign = _is_assign(src, i, symbols)
+                yield OutlineEntry(ASSIGN if assign else COMMAND, name, pos)
+        elif src.startswith('*', i):
+            j = SPACE_PATTERN.match(src, i + 1).end()
+            if m := ID_PATTERN.match(src, j):
+                if (name := _symbol_name(m.group(0), symbols)) is not None:
+                    yield OutlineEntry(LABEL, name, TokenPosition(row, j - column_origin + 1))
+                i = m.end()
+
+        i, row, column_origin = _skip_rest(src, i, row, column_origin)
+
+
+def outline_str(src: str) -> list[OutlineEntry]:
+    return list(iter_outline(src))
+
+
+def outline_file(srcfile: Union[Path, str]) -> list[OutlineEntry]:
+    with open(srcfile, encoding=SRC_ENCODING) as f:
+        return outline_str(f.read())
+
+
+def find_label(srcfiles: Iterable[Union[Path, str]], name: str) -> list[tuple]:
+    # 戻り値: ラベルを定義している (ファイル, 位置) のリスト
+    found = []
+    for srcfile in srcfiles:
+        for e in outline_file(srcfile):
+            if e.kind == LABEL and e.name == name:
+                found.append((srcfile, e.pos))
+    return found
@@ -1,8 +1,16 @@
-from typing import Optional, Union
+from typing import Iterable, Iterator, Optional, Union
 from enum import Enum, auto
 from pathlib import Path
 from collections import namedtuple
-from .tokenizer import Tokenizer, Token
+from .tokenizer import Tokenizer, Token, format_position
+from .preprocessor import Preprocessor
+
+
+def _value_key(value):
+    # Tokenの等価性は種別と文字列で決まる (位置は無視する)
+    if isinstance(value, Token):
+        return (value.tag, value.src)
+    return value
 
 
 class Node():
@@ -58,6 +66,11 @@ class Node():
         self.tag = tag
         self.child_nodes = child_nodes
         self.value = value
+        # 部分木の構造ハッシュ
+        # 子ノードは生成済みなので、構文解析と同時にボトムアップで計算される
+        # (Enum/strのハッシュを使うため、値は同一プロセス内でのみ比較できる)
+        self.hash_value = hash((tag, _value_key(value), *(c.hash_value for c in child_nodes)))
+        self.size = 1 + sum(c.size for c in child_nodes)
 
     def tag_str(self):
         if self.tag not in self.TAG_TO_STR:
@@ -149,7 +162,25 @@ class Node():
     def Atom(cls, *, value):
         return Node(cls.NodeType.ATOM, value=value)
 
+    def first_token(self) -> Optional[Token]:
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node.value, Token):
+                return node.value
+            stack.extend(reversed(node.child_nodes))
+
     def __eq__(self, other) -> bool:
+        if self is other:
+            return True
+
+        if not isinstance(other, Node):
+            return NotImplemented
+
+        # ハッシュが異なれば部分木を比較するまでもなく異なる
+        if self.hash_value != other.hash_value:
+            return False
+
         if self.tag != other.tag:
             return False
 
@@ -166,8 +197,8 @@ class Node():
 
         return True
 
-    def __ne__(self, other) -> bool:
-        return not self.__eq__(other)
+    def __hash__(self) -> int:
+        return self.hash_value
 
     def __repr__(self) -> str:
         def join(child_nodes):
@@ -201,57 +232,95 @@ class ParseError(Exception):
     pass
 
 
+# 構文解析で使う表
+# モジュールの読み込み時に一度だけ作り、以後は読み取り専用として全スレッドで共有する
+_ATOM_TAGS = frozenset([Token.TokenType.ID, Token.TokenType.INT, Token.TokenType.STR])
+_LINE_END_TAGS = frozenset([Token.TokenType.NEWLINE, Token.TokenType.EOF])
+
+# 演算子 -> 二項演算のノードのタグ
+_COMP_OPS = {
+    '=': Node.NodeType.EQ_EXPR,
+    '==': Node.NodeType.EQ_EXPR,
+    '!': Node.NodeType.NEQ_EXPR,
+    '!=': Node.NodeType.NEQ_EXPR,
+    '<': Node.NodeType.LT_EXPR,
+    '<=': Node.NodeType.LTEQ_EXPR,
+    '>': Node.NodeType.GT_EXPR,
+    '>=': Node.NodeType.GTEQ_EXPR,
+}
+_ADD_OPS = {
+    '+': Node.NodeType.ADD_EXPR,
+    '-': Node.NodeType.SUB_EXPR,
+}
+_MUL_OPS = {
+    '*': Node.NodeType.MUL_EXPR,
+    '/': Node.NodeType.DIV_EXPR,
+    '\\': Node.NodeType.MOD_EXPR,
+}
+
+
 class Parser():
 
-    def __init__(self):
-        pass
+    # Parserは構文解析中の状態をインスタンスに持たない (途中の状態はすべてローカル変数)
+    # そのため、1つのParserを複数のスレッドから同時に使ってよい
+    # インスタンス間で共有されうる可変な状態はIncludeCacheのみで、IncludeCacheはロックで保護されている
 
-    def _read_srcfile(self, srcfile):
-        with open(srcfile, encoding='CP932') as f:
-            return f.read()
+    def __init__(self, preprocessor: Optional[Preprocessor] = None, debug: bool = True):
+        self.preprocessor = preprocessor if preprocessor is not None else Preprocessor()
+        self.debug = debug
 
     def parse_file(self, srcfile: Union[Path, str]) -> Node:
-        src = self._read_srcfile(srcfile)
-        return self.parse_str(src)
+        tokens = self.preprocessor.preprocess_file(srcfile)
+        return self._parse_preprocessed(tokens)
 
     def parse_str(self, src: str) -> Node:
-        tokens = Tokenizer().tokenize(src)
-        print('parse: tokens')
-        print(tokens)
-        print([format(t, '({src}:{row}:{column})') for t in tokens])
+        tokens = self.preprocessor.preprocess_tokens(Tokenizer().tokenize(src))
+        return self._parse_preprocessed(tokens)
+
+    def _parse_preprocessed(self, tokens: list[Token]) -> Node:
+        if self.debug:
+            print('parse: tokens')
+            print(tokens)
+            print([format(t, '({src}:{row}:{column})') for t in tokens])
 
         ast = self.parse_tokens(tokens)
-        print('parse: ast')
-        print(ast)
-        print_node(ast)
+        if self.debug:
+            print('parse: ast')
+            print(ast)
+            print_node(ast)
 
         return ast
 
-    def parse_tokens(self, tokens: list[Token]) -> Node:
-        stmts = []
+    def parse_tokens(self, tokens: Iterable[Token]) -> Node:
+        return Node.Stmts(*self.iter_stmts(tokens))
+
+    def iter_file(self, srcfile: Union[Path, str]) -> Iterator[Node]:
+        return self.iter_stmts(self.preprocessor.iter_file(srcfile))
 
+    def iter_stmts(self, tokens: Iterable[Token]) -> Iterator[Node]:
+        # 文は必ず改行(またはEOF)で終わるので、1行ずつ構文解析する
+        line = []
+        for tok in tokens:
+            line.append(tok)
+            if tok.tag in _LINE_END_TAGS:
+                yield from self._parse_line(line)
+                line = []
+
+    def _parse_line(self, tokens: list[Token]) -> Iterator[Node]:
         i = 0
-        while tokens[i].tag != Token.TokenType.EOF:
+        n = len(tokens)
+        while i < n and tokens[i].tag != Token.TokenType.EOF:
 
             if m := self._match_stmt(tokens[i:]):
                 if m.value.tag != Node.NodeType.EMPTY_STMT:  # Skip EmptyStmt
-                    stmts.append(m.value)
+                    yield m.value
                 i += m.num_consumed
             else:
-                raise ParseError(f'''parse_tokens: unexpected token {format(tokens[i], '"{src}" (row:{row} column:{column})')}''')
-
-        return Node.Stmts(*stmts)
+                raise ParseError(f'parse_tokens: unexpected token "{tokens[i].src}" ({format_position(tokens[i].pos)})')
 
     def _match_stmt(self, tokens: list[Token]) -> Optional[MatchResult]:
-        methods = [
-            self._match_empty_stmt,
-            self._match_label_stmt,
-            self._match_assign_stmt,
-            self._match_call_stmt,
-        ]
-
-        for match in methods:
-            if m := match(tokens):
+        for match in _STMT_MATCHERS:
+            if m := match(self, tokens):
                 if tokens[m.num_consumed].tag == Token.TokenType.NEWLINE:  # Consume NEWLINE
                     return MatchResult(m.value, m.num_consumed + 1)
 
@@ -298,7 +367,7 @@ class Parser():
         i = 1
         n = len(tokens)
 
-        if tokens[1].tag in [Token.TokenType.NEWLINE, Token.TokenType.EOF]:
+        if tokens[1].tag in _LINE_END_TAGS:
             pass
         elif tokens[1].src == ',':
             args.append(Node.Default())
@@ -309,7 +378,7 @@ class Parser():
             return
 
         while i < n:
-            if tokens[i].tag in [Token.TokenType.NEWLINE, Token.TokenType.EOF]:
+            if tokens[i].tag in _LINE_END_TAGS:
                 break
 
             if tokens[i].src != ',':
@@ -346,30 +415,15 @@ class Parser():
 
         i = m.num_consumed
         n = len(tokens)
-        op = None
         while i < n:
-            if tokens[i].src in ['=', '==', '!', '!=', '<', '<=', '>', '>=']:
-                op = tokens[i].src
+            if (tag := _COMP_OPS.get(tokens[i].src)) is not None:
                 i += 1
             else:
                 break
 
             if m := self._match_add_expr(tokens[i:]):
                 operands.append(m.value)
-                if op in ['=', '==']:
-                    node = Node.EqExpr(*operands)
-                elif op in ['!', '!=']:
-                    node = Node.NeqExpr(*operands)
-                elif op == '<':
-                    node = Node.LtExpr(*operands)
-                elif op == '<=':
-                    node = Node.LtEqExpr(*operands)
-                elif op == '>':
-                    node = Node.GtExpr(*operands)
-                elif op == '>=':
-                    node = Node.GtEqExpr(*operands)
-                else:
-                    assert False
+                node = Node(tag, *operands)
                 operands = [node]
                 i += m.num_consumed
             else:
@@ -388,20 +442,15 @@ class Parser():
 
         i = m.num_consumed
         n = len(tokens)
-        op = None
         while i < n:
-            if tokens[i].src in ['+', '-']:
-                op = tokens[i].src
+            if (tag := _ADD_OPS.get(tokens[i].src)) is not None:
                 i += 1
             else:
                 break
 
             if m := self._match_mul_expr(tokens[i:]):
                 operands.append(m.value)
-                if op == '+':
-                    node = Node.AddExpr(*operands)
-                else:
-                    node = Node.SubExpr(*operands)
+                node = Node(tag, *operands)
                 operands = [node]
                 i += m.num_consumed
             else:
@@ -413,29 +462,22 @@ class Parser():
     def _match_mul_expr(self, tokens: list[Token]) -> Optional[MatchResult]:
         operands = []
 
-        if m := self._match_atom(tokens):
+        if m := self._match_operand(tokens):
             operands.append(m.value)
         else:
             return
 
         i = m.num_consumed
         n = len(tokens)
-        op = None
         while i < n:
-            if tokens[i].src in ['*', '/', '\\']:
-                op = tokens[i].src
+            if (tag := _MUL_OPS.get(tokens[i].src)) is not None:
                 i += 1
             else:
-                    break
+                break
 
-            if m := self._match_atom(tokens[i:]):
+            if m := self._match_operand(tokens[i:]):
                 operands.append(m.value)
-                if op == '*':
-                    node = Node.MulExpr(*operands)
-                elif op == '/':
-                    node = Node.DivExpr(*operands)
-                else:
-                    node = Node.ModExpr(*operands)
+                node = Node(tag, *operands)
                 operands = [node]
                 i += m.num_consumed
             else:
@@ -444,6 +486,28 @@ class Parser():
         node = operands[0]
         return MatchResult(node, i)
 
+    def _match_operand(self, tokens: list[Token]) -> Optional[MatchResult]:
+        if m := self._match_atom(tokens):
+            return m
+        elif m := self._match_paren_expr(tokens):
+            return m
+
+    def _match_paren_expr(self, tokens: list[Token]) -> Optional[MatchResult]:
+        if tokens[0].tag != Token.TokenType.SIGN or tokens[0].src != '(':
+            return
+
+        if m := self._match_comp_expr(tokens[1:]):
+            pass
+        else:
+            return
+
+        close = tokens[1 + m.num_consumed]
+        if close.tag != Token.TokenType.SIGN or close.src != ')':
+            return
+
+        # 括弧は優先順位を変えるだけなので、ノードは作らない
+        return MatchResult(m.value, m.num_consumed + 2)
+
     def _match_label_literal(self, tokens: list[Token]) -> Optional[MatchResult]:
         if len(tokens) < 2:
             return
@@ -458,13 +522,15 @@ class Parser():
         return MatchResult(node, 2)
 
     def _match_atom(self, tokens: list[Token]) -> Optional[MatchResult]:
-
-        atom_tags = [
-            Token.TokenType.ID,
-            Token.TokenType.INT,
-            Token.TokenType.STR
-        ]
-
-        if tokens[0].tag in atom_tags:
+        if tokens[0].tag in _ATOM_TAGS:
             node = Node.Atom(value=tokens[0])
             return MatchResult(node, 1)
+
+
+# 文の候補 (先に一致したものを採用する)
+_STMT_MATCHERS = (
+    Parser._match_empty_stmt,
+    Parser._match_label_stmt,
+    Parser._match_assign_stmt,
+    Parser._match_call_stmt,
+)
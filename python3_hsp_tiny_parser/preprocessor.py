@@ -0,0 +1,385 @@
+import os
+import threading
+from typing import Iterable, Iterator, Optional, Union
+from pathlib import Path
+from collections import namedtuple
+from .tokenizer import TokenPosition, Token, TokenizeError, Tokenizer, format_position
+
+
+SRC_ENCODING = 'CP932'
+
+UNSUPPORTED_DIRECTIVES = ('module', 'global', 'deffunc', 'defcfunc')
+
+
+class PreprocessError(Exception):
+    def __init__(self, message: str, pos: TokenPosition):
+        self.args = f'{message} (at {format_position(pos)})',
+
+
+# tokens: ファイル単体のトークン列 (EOFを含む)
+# guard: ファイル全体が `#ifndef X` 〜 `#endif` で囲まれている場合のX
+CacheEntry = namedtuple('CacheEntry', ['mtime_ns', 'tokens', 'guard'])
+
+
+def _iter_lines(tokens: Iterable[Token]) -> Iterator[list[Token]]:
+    # 各行は改行またはEOFで終わる
+    line = []
+    for t in tokens:
+        line.append(t)
+        if t.tag in (Token.TokenType.NEWLINE, Token.TokenType.EOF):
+            yield line
+            line = []
+    if line:
+        yield line
+
+
+def _is_directive(line: list[Token]) -> bool:
+    return len(line) >= 2 and line[0].src == '#' and line[1].tag == Token.TokenType.ID
+
+
+def _directive_args(line: list[Token]) -> list[Token]:
+    return [t for t in line[2:] if t.tag not in (Token.TokenType.NEWLINE, Token.TokenType.EOF)]
+
+
+def _find_guard(tokens: list[Token]) -> Optional[str]:
+    lines = [line for line in _iter_lines(tokens)
+             if line[0].tag not in (Token.TokenType.NEWLINE, Token.TokenType.EOF)]
+    if len(lines) < 2:
+        return
+    first, last = lines[0], lines[-1]
+    if not (_is_directive(first) and first[1].src == 'ifndef'):
+        return
+    if not (_is_directive(last) and last[1].src == 'endif'):
+        return
+
+    # 先頭の#ifndefに対応する#endifが末尾であることを確認する
+    # 対応する#elseがあれば、2回目以降のインクルードで#else側が展開されるのでガードではない
+    depth = 0
+    for i, line in enumerate(lines):
+        if not _is_directive(line):
+            continue
+        if line[1].src in ('ifdef', 'ifndef'):
+            depth += 1
+        elif line[1].src == 'else' and depth == 1:
+            return
+        elif line[1].src == 'endif':
+            depth -= 1
+            if depth == 0 and i != len(lines) - 1:
+                return
+
+    args = _directive_args(first)
+    if len(args) == 1 and args[0].tag == Token.TokenType.ID:
+        return args[0].src
+
+
+def _with_srcfile(tokens: Iterable[Token], path: Path) -> Iterator[Token]:
+    # インクルードされたファイルのトークンには、そのファイルのパスを付ける
+    for t in tokens:
+        yield Token(t.tag, t.pos._replace(srcfile=path), t.src)
+
+
+def _mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _iter_file_tokens(path: Path) -> Iterator[Token]:
+    with open(path, encoding=SRC_ENCODING) as f:
+        yield from Tokenizer().iter_lines(f)
+
+
+class IncludeCache():
+
+    # 複数のスレッドで共有できるよう、内部の表はロックで保護する
+    # (ファイルの読み込みと字句解析はロックの外で行う)
+
+    def __init__(self, include_dirs: tuple = ()):
+        self.include_dirs = tuple(Path(d) for d in include_dirs)
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._expanded = {}
+        self._dependencies = {}
+        self._dependents = {}
+
+    def resolve(self, name: str, basedir: Path) -> Optional[Path]:
+        for d in (basedir, *self.include_dirs):
+            path = d / name
+            if path.is_file():
+                return path.resolve()
+
+    def entry(self, path: Path) -> CacheEntry:
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            if (e := self._entries.get(path)) and e.mtime_ns == mtime_ns:
+                return e
+
+        with open(path, encoding=SRC_ENCODING) as f:
+            tokens = Tokenizer().tokenize(f.read())
+
+        with self._lock:
+            # 他のスレッドが先に読み込んでいれば、そちらを使う
+            if (e := self._entries.get(path)) and e.mtime_ns == mtime_ns:
+                return e
+            if e is not None:
+                self.invalidate(path)
+
+            e = CacheEntry(mtime_ns, tokens, _find_guard(tokens))
+            self._entries[path] = e
+            return e
+
+    def is_stale(self, path: Path) -> bool:
+        with self._lock:
+            e = self._entries.get(path)
+        try:
+            return e is None or e.mtime_ns != os.stat(path).st_mtime_ns
+        except OSError:
+            return True
+
+    def add_dependency(self, path: Path, dependency: Path):
+        with self._lock:
+            self._dependencies.setdefault(path, set()).add(dependency)
+            self._dependents.setdefault(dependency, set()).add(path)
+
+    def dependencies(self, path: Path) -> set[Path]:
+        with self._lock:
+            return set(self._dependencies.get(path, ()))
+
+    def dependents(self, path: Path) -> set[Path]:
+        with self._lock:
+            found = set()
+            stack = [path]
+            while stack:
+                for p in self._dependents.get(stack.pop(), ()):
+                    if p not in found:
+                        found.add(p)
+                        stack.append(p)
+            return found
+
+    def invalidate(self, path: Path):
+        # 変更されたファイルと、それを(間接的に)インクルードしているファイルの展開結果のみ破棄する
+        with self._lock:
+            for p in {path} | self.dependents(path):
+                self._expanded.pop(p, None)
+            self._entries.pop(path, None)
+            for dependency in self._dependencies.pop(path, ()):
+                self._dependents.get(dependency, set()).discard(path)
+
+    def get_expanded(self, path: Path) -> Optional[list[Token]]:
+        with self._lock:
+            if (e := self._expanded.get(path)) is None:
+                return
+            tokens, mtimes = e
+            for p, mtime_ns in mtimes.items():
+                if _mtime_ns(p) != mtime_ns:
+                    if self.is_stale(p):
+                        self.invalidate(p)
+                    self._expanded.pop(path, None)
+                    return
+            return tokens
+
+    def set_expanded(self, path: Path, tokens: list[Token], mtimes: dict):
+        # mtimes: 展開に使ったファイル -> そのmtime
+        # 他のスレッドが先に新しいファイルを読み込んでいれば、古いファイルから作った展開結果は保存しない
+        with self._lock:
+            for p, mtime_ns in mtimes.items():
+                if (e := self._entries.get(p)) is None or e.mtime_ns != mtime_ns:
+                    return
+            self._expanded[path] = (tokens, mtimes)
+
+
+class Preprocessor():
+
+    def __init__(self, cache: Optional[IncludeCache] = None):
+        self.cache = cache if cache is not None else IncludeCache()
+
+    def preprocess_file(self, srcfile: Union[Path, str]) -> list[Token]:
+        path = Path(srcfile).resolve()
+        if tokens := self.cache.get_expanded(path):
+            return tokens
+
+        entry = self.cache.entry(path)
+        expansion = _Expansion(self.cache)
+        expansion.mtimes[path] = entry.mtime_ns
+        expanded = list(expansion.run(entry.tokens, path.parent, path))
+        self.cache.set_expanded(path, expanded, expansion.mtimes)
+        return expanded
+
+    def preprocess_tokens(self, tokens: Iterable[Token], basedir: Union[Path, str] = '.') -> list[Token]:
+        return list(self.iter_tokens(tokens, basedir))
+
+    def iter_tokens(self, tokens: Iterable[Token], basedir: Union[Path, str] = '.') -> Iterator[Token]:
+        return _Expansion(self.cache).run(tokens, Path(basedir).resolve(), None)
+
+    def iter_file(self, srcfile: Union[Path, str]) -> Iterator[Token]:
+        # 巨大なファイル向け: 展開結果をキャッシュせず、ファイルを1行ずつ読みながら字句解析・展開する
+        # (インクルードされるファイルは通常どおりキャッシュに読み込む)
+        path = Path(srcfile).resolve()
+        return _Expansion(self.cache).run(_iter_file_tokens(path), path.parent, path)
+
+
+class _Expansion():
+
+    def __init__(self, cache: IncludeCache):
+        self.cache = cache
+        self.symbols = {}
+        self.include_stack = []
+        self.last_tag = None
+        # 展開に使ったファイル -> そのmtime (同じファイルを複数回読んだ場合は最初のもの)
+        self.mtimes = {}
+
+    def run(self, tokens: Iterable[Token], basedir: Path, path: Optional[Path]) -> Iterator[Token]:
+        if path is not None:
+            self.include_stack.append(path)
+        eof = yield from self._expand(tokens, basedir, path)
+        yield eof
+
+    def _expand(self, tokens: Iterable[Token], basedir: Path, path: Optional[Path]):
+        # 条件の成否のスタック (#ifdef/#ifndef/#else/#endif)
+        conds = []
+        eof = None
+
+        for line in _iter_lines(tokens):
+            if line[-1].tag == Token.TokenType.EOF:
+                eof = line.pop()
+                if not line:
+                    continue
+
+            if not _is_directive(line):
+                if all(conds):
+                    for t in self._substitute(line):
+                        self.last_tag = t.tag
+                        yield t
+                continue
+
+            name = line[1].src
+            args = _directive_args(line)
+
+            if name in ('ifdef', 'ifndef'):
+                symbol = self._symbol_arg(line, args)
+                conds.append((symbol in self.symbols) == (name == 'ifdef'))
+            elif name == 'else':
+                if not conds:
+                    raise PreprocessError('#else without #if', line[0].pos)
+                conds[-1] = not conds[-1]
+            elif name == 'endif':
+                if not conds:
+                    raise PreprocessError('#endif without #if', line[0].pos)
+                conds.pop()
+            elif not all(conds):
+                pass
+            elif name == 'include':
+                yield from self._include(line, args, basedir, path)
+            elif name == 'const':
+                symbol = self._symbol_arg(line, args[:1])
+                self.symbols[symbol] = [self._fold_const(line, self._substitute(args[1:]))]
+            elif name == 'define':
+                symbol = self._symbol_arg(line, args[:1])
+                self.symbols[symbol] = self._substitute(args[1:])
+            elif name in UNSUPPORTED_DIRECTIVES:
+                raise PreprocessError(f'preprocess: unsupported directive "#{name}"', line[0].pos)
+            else:
+                raise PreprocessError(f'preprocess: unknown directive "#{name}"', line[0].pos)
+
+        if conds:
+            raise PreprocessError('missing "#endif"', eof.pos)
+
+        return eof
+
+    def _include(self, line: list[Token], args: list[Token], basedir: Path, path: Optional[Path]):
+        if len(args) != 1 or args[0].tag != Token.TokenType.STR:
+            raise PreprocessError('#include requires a file name', line[0].pos)
+
+        included = self.cache.resolve(args[0].src, basedir)
+        if included is None:
+            raise PreprocessError(f'#include: file not found "{args[0].src}"', args[0].pos)
+        if included in self.include_stack:
+            raise PreprocessError(f'#include: recursive include "{args[0].src}"', args[0].pos)
+
+        for p in self.include_stack:
+            self.cache.add_dependency(p, included)
+
+        try:
+            entry = self.cache.entry(included)
+        except TokenizeError as e:
+            raise TokenizeError(e.message, e.pos._replace(srcfile=included)) from None
+        self.mtimes.setdefault(included, entry.mtime_ns)
+        # インクルードガード済みのファイルは再展開しない
+        if entry.guard is not None and entry.guard in self.symbols:
+            return
+
+        self.include_stack.append(included)
+        eof = yield from self._expand(_with_srcfile(entry.tokens, included), included.parent, included)
+        self.include_stack.pop()
+
+        # インクルードしたファイルの末尾に改行がなくても文が連結されないようにする
+        if self.last_tag not in (None, Token.TokenType.NEWLINE):
+            self.last_tag = Token.TokenType.NEWLINE
+            yield Token.Newline(eof.pos)
+
+    def _symbol_arg(self, line: list[Token], args: list[Token]) -> str:
+        if len(args) != 1 or args[0].tag != Token.TokenType.ID:
+            raise PreprocessError(f'#{line[1].src} requires a name', line[0].pos)
+        return args[0].src
+
+    def _substitute(self, tokens: list[Token]) -> list[Token]:
+        out = []
+        for t in tokens:
+            if t.tag == Token.TokenType.ID and t.src in self.symbols:
+                out.extend(Token(s.tag, t.pos, s.src) for s in self.symbols[t.src])
+            else:
+                out.append(t)
+        return out
+
+    def _fold_const(self, line: list[Token], tokens: list[Token]) -> Token:
+        if len(tokens) == 1 and tokens[0].tag == Token.TokenType.STR:
+            return tokens[0]
+
+        value, i = _eval_add(tokens, 0)
+        if value is None or i != len(tokens):
+            raise PreprocessError('#const requires a constant expression', line[0].pos)
+        if value < 0:
+            raise PreprocessError('#const: negative constants are not supported', line[0].pos)
+        return Token.Int(line[0].pos, str(value))
+
+
+def _div(a: int, b: int) -> int:
+    # HSPの整数除算は0方向への切り捨て
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def _eval_add(tokens: list[Token], i: int):
+    value, i = _eval_mul(tokens, i)
+    while value is not None and i < len(tokens) and tokens[i].src in ('+', '-'):
+        op = tokens[i].src
+        rhs, i = _eval_mul(tokens, i + 1)
+        if rhs is None:
+            return None, i
+        value = value + rhs if op == '+' else value - rhs
+    return value, i
+
+
+def _eval_mul(tokens: list[Token], i: int):
+    value, i = _eval_atom(tokens, i)
+    while value is not None and i < len(tokens) and tokens[i].src in ('*', '/', '\\'):
+        op = tokens[i].src
+        rhs, i = _eval_atom(tokens, i + 1)
+        if rhs is None:
+            return None, i
+        if op == '*':
+            value *= rhs
+        elif rhs == 0:
+            return None, i
+        elif op == '/':
+            value = _div(value, rhs)
+        else:
+            value -= _div(value, rhs) * rhs
+    return value, i
+
+
+def _eval_atom(tokens: list[Token], i: int):
+    if i < len(tokens) and tokens[i].tag == Token.TokenType.INT:
+        return int(tokens[i].src), i + 1
+    return None, i
@@ -0,0 +1,242 @@
+import re
+import heapq
+from typing import Iterable, Optional, Union
+from pathlib import Path
+from collections import namedtuple
+from .tokenizer import Token
+from .parser import Node, Parser
+
+
+NodeType = Node.NodeType
+
+# タグの表記 ('Call', 'CALL_STMT', '+' など) からNodeTypeを引く
+STR_TO_TAG = {
+    **{s: tag for tag, s in Node.TAG_TO_STR.items()},
+    **{tag.name: tag for tag in NodeType},
+}
+
+Match = namedtuple('Match', ['srcfile', 'node', 'pos'])
+
+
+class QueryError(Exception):
+    pass
+
+
+class Pattern():
+
+    # 候補となるノードのタグ (Noneなら全ノード)
+    tags = None
+
+    def match(self, node: Node) -> bool:
+        return False
+
+
+class _Any(Pattern):
+
+    def match(self, node: Node) -> bool:
+        return True
+
+    def __repr__(self) -> str:
+        return '_'
+
+
+# 任意の1ノード
+ANY = _Any()
+
+# 残りの子ノードすべて (子ノードの並びの末尾にのみ書ける)
+REST = ...
+
+
+def _to_tag(tag: Union[NodeType, str]) -> NodeType:
+    if isinstance(tag, NodeType):
+        return tag
+    if tag not in STR_TO_TAG:
+        raise QueryError(f'unknown tag "{tag}"')
+    return STR_TO_TAG[tag]
+
+
+class Q(Pattern):
+
+    def __init__(self, tag, *children, exact: bool = False):
+        # tag: タグ、タグの並び、またはNone (任意のタグ)
+        # children: 子ノードのパターン。省略時はexact=Falseなら子ノードを問わない
+        if tag is None:
+            self.tags = None
+        elif isinstance(tag, (tuple, list, set, frozenset)):
+            self.tags = frozenset(_to_tag(t) for t in tag)
+        else:
+            self.tags = frozenset([_to_tag(tag)])
+
+        if REST in children[:-1]:
+            raise QueryError('"..." must be the last child pattern')
+
+        self.rest = bool(children) and children[-1] is REST
+        self.children = children[:-1] if self.rest else children
+        self.exact = exact or bool(children)
+
+    def match(self, node: Node) -> bool:
+        if self.tags is not None and node.tag not in self.tags:
+            return False
+
+        if not self.exact:
+            return True
+
+        n = len(self.children)
+        if len(node.child_nodes) < n or (not self.rest and len(node.child_nodes) != n):
+            return False
+
+        for p, child in zip(self.children, node.child_nodes):
+            if not p.match(child):
+                return False
+
+        return True
+
+    def __repr__(self) -> str:
+        tags = '_' if self.tags is None else '|'.join(sorted(Node.TAG_TO_STR[t] for t in self.tags))
+        children = [repr(c) for c in self.children] + (['...'] if self.rest else [])
+        return f'({" ".join([tags, *children])})'
+
+
+class Tok(Pattern):
+
+    tags = frozenset([NodeType.ATOM])
+
+    def __init__(self, kind: Optional[str] = None, src: Optional[str] = None):
+        # kind: 'ID', 'INT', 'STR'
+        self.kind = Token.TokenType[kind] if kind is not None else None
+        self.src = src
+
+    def match(self, node: Node) -> bool:
+        if node.tag != NodeType.ATOM or not isinstance(node.value, Token):
+            return False
+        if self.kind is not None and node.value.tag != self.kind:
+            return False
+        if self.src is not None and node.value.src != self.src:
+            return False
+        return True
+
+    def __repr__(self) -> str:
+        kind = self.kind.name if self.kind is not None else '_'
+        return kind if self.src is None else f'{kind}:{self.src}'
+
+
+# クエリ文字列
+#   (Call ID:mes (Args STR ...))   mesの第1引数が文字列の命令文
+#   (==|!=|<|<=|>|>= _ INT)        整数リテラルとの比較
+#   _      任意のノード
+#   ...    残りの子ノード
+#   ID, INT, STR, ID:name, STR:"text"   Atom
+#   Default, LabelLiteral など         (子ノードを問わない) ノード
+QUERY_TOKEN_PATTERN = re.compile(r'\s*(\(|\)|[A-Z]+:"(?:[^"\\]|\\.)*"|[^\s()]+)')
+
+
+def parse_query(query: str) -> Pattern:
+    words = []
+    i = 0
+    while i < len(query):
+        if query[i:].isspace():
+            break
+        m = QUERY_TOKEN_PATTERN.match(query, i)
+        if m is None:
+            raise QueryError(f'invalid query "{query}"')
+        words.append(m.group(1))
+        i = m.end()
+
+    pattern, i = _parse_pattern(words, 0)
+    if pattern is REST:
+        raise QueryError('"..." is not a pattern')
+    if i != len(words):
+        raise QueryError(f'unexpected "{words[i]}" in query')
+    return pattern
+
+
+def _parse_pattern(words: list[str], i: int):
+    if i >= len(words):
+        raise QueryError('unexpected end of query')
+
+    word = words[i]
+    if word == '(':
+        if i + 1 >= len(words) or words[i + 1] in ('(', ')'):
+            raise QueryError('missing tag after "("')
+        head = words[i + 1]
+        tag = None if head == '_' else head.split('|')
+        children = []
+        i += 2
+        while i < len(words) and words[i] != ')':
+            child, i = _parse_pattern(words, i)
+            children.append(child)
+        if i >= len(words):
+            raise QueryError('missing ")"')
+        return Q(tag, *children, exact=True), i + 1
+    elif word == ')':
+        raise QueryError('unexpected ")"')
+    elif word == '_':
+        return ANY, i + 1
+    elif word == '...':
+        return REST, i + 1
+
+    kind, sep, src = word.partition(':')
+    if kind in Token.TokenType.__members__:
+        if sep and src.startswith('"'):
+            src = src[1:-1]
+        return Tok(kind, src if sep else None), i + 1
+
+    return Q(word.split('|')), i + 1
+
+
+class TreeIndex():
+
+    def __init__(self, ast: Node):
+        # タグごとに (先行順の通し番号, ノード) を先行順で並べておく
+        self.ast = ast
+        self.by_tag = {}
+        self.nodes = []
+
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            entry = (len(self.nodes), node)
+            self.nodes.append(entry)
+            self.by_tag.setdefault(node.tag, []).append(entry)
+            stack.extend(reversed(node.child_nodes))
+
+    def candidates(self, pattern: Pattern) -> Iterable[Node]:
+        if pattern.tags is None:
+            entries = self.nodes
+        elif len(pattern.tags) == 1:
+            entries = self.by_tag.get(next(iter(pattern.tags)), [])
+        else:
+            entries = heapq.merge(*(self.by_tag.get(t, []) for t in pattern.tags),
+                                  key=lambda e: e[0])
+        return (node for __, node in entries)
+
+    def find(self, pattern: Union[Pattern, str]) -> list[Node]:
+        if isinstance(pattern, str):
+            pattern = parse_query(pattern)
+        return [node for node in self.candidates(pattern) if pattern.match(node)]
+
+
+def find(ast: Node, pattern: Union[Pattern, str]) -> list[Node]:
+    return TreeIndex(ast).find(pattern)
+
+
+def run_batch(queries: dict, srcfiles: Iterable[Union[Path, str]],
+              parser: Optional[Parser] = None) -> dict:
+    # queries: 名前 -> パターン(またはクエリ文字列)
+    # 戻り値: 名前 -> Matchのリスト
+    # 各ファイルは1回だけ構文解析・索引付けし、すべてのクエリを実行する
+    if parser is None:
+        parser = Parser(debug=False)
+
+    patterns = {name: parse_query(q) if isinstance(q, str) else q
+                for name, q in queries.items()}
+    results = {name: [] for name in patterns}
+
+    for srcfile in srcfiles:
+        index = TreeIndex(parser.parse_file(srcfile))
+        for name, pattern in patterns.items():
+            for node in index.find(pattern):
+                tok = node.first_token()
+                results[name].append(Match(srcfile, node, tok.pos if tok else None))
+
+    return results
@@ -1,9 +1,50 @@
 import re
+from typing import Iterable, Iterator, Optional
 from enum import Enum, auto
 from collections import namedtuple
 
 
-TokenPosition = namedtuple('TokenPosition', ['row', 'column'])
+# srcfile: インクルードされたファイルのトークンのみ、そのファイルのパス (解析対象のファイル自身のトークンはNone)
+TokenPosition = namedtuple('TokenPosition', ['row', 'column', 'srcfile'], defaults=(None,))
+
+INT_PATTERN = re.compile(r'\d+')
+ID_PATTERN = re.compile(r'[_a-zA-Z]\w*')
+LINE_REST_PATTERN = re.compile(r'[^\r\n]*')
+# \の次の文字は(改行や'"'も含めて)読み飛ばす
+STR_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+NEWLINE_PATTERN = re.compile(r'\r\n|\r|\n')
+
+
+# コメントと文字列の範囲 (Tokenizerとoutlineで共有する)
+
+def skip_line_comment(src: str, i: int) -> int:
+    # src[i:]は';'または'//'で始まる。行末(改行の直前)の位置を返す
+    return LINE_REST_PATTERN.match(src, i).end()
+
+
+def skip_block_comment(src: str, i: int) -> int:
+    # src[i:]は'/*'で始まる。'*/'の直後の位置を返す (閉じていなければ-1)
+    end = src.find('*/', i + 2)
+    return end if end < 0 else end + 2
+
+
+def skip_str(src: str, i: int) -> int:
+    # src[i]は'"'。閉じる'"'の直後の位置を返す (閉じていなければ-1)
+    m = STR_PATTERN.match(src, i)
+    return m.end() if m else -1
+
+
+def format_position(pos: TokenPosition) -> str:
+    if pos.srcfile is None:
+        return f'row:{pos.row} column:{pos.column}'
+    return f'{pos.srcfile} row:{pos.row} column:{pos.column}'
+
+
+def position_key(pos: Optional[TokenPosition]) -> tuple:
+    # 並べ替え用 (解析対象のファイル自身の位置が先で、インクルードされたファイルの位置はファイルごとにまとめる)
+    if pos is None:
+        return ('', 0, 0)
+    return (str(pos.srcfile or ''), pos.row, pos.column)
 
 
 class Token():
@@ -83,14 +124,22 @@ class Token():
 
     def __format__(self, format_spec):
         if format_spec:
-            return format_spec.format(tag=self.tag, pos=self.pos, row=self.pos.row, column=self.pos.column, src=self.src)
+            return format_spec.format(tag=self.tag, pos=self.pos, row=self.pos.row, column=self.pos.column,
+                                      srcfile=self.pos.srcfile, src=self.src)
         else:
             return repr(self)
 
 
 class TokenizeError(Exception):
     def __init__(self, message: str, pos: TokenPosition):
-        self.args = f'{message} (at row:{pos.row} column:{pos.column})',
+        self.message = message
+        self.pos = pos
+        self.args = f'{message} (at {format_position(pos)})',
+
+
+class _Incomplete(Exception):
+    # 範囲コメントまたは文字列が、読み込んだ範囲の中で閉じていない
+    pass
 
 
 class Tokenizer():
@@ -99,18 +148,61 @@ class Tokenizer():
     # 加減演算子: + -
     # 比較演算子: = == ! != < <= > >=
     # 論理演算子: & | ^
-    ONE_CHARACTER_SIGNS = tuple('=+-*/\\=<>!&|^,')
+    # 括弧: ( )
+    # プリプロセッサ: #
+    ONE_CHARACTER_SIGNS = tuple('=+-*/\\=<>!&|^,()#')
     SOME_CHARACTER_SIGNS = ('==', '!=', '<=', '>=', '>>', '<<')
 
     def __init__(self):
         pass
 
-    def tokenize(self, src):
-        tokens = []
+    def tokenize(self, src) -> list[Token]:
+        return list(self.iter_tokens(src))
+
+    def iter_tokens(self, src) -> Iterator[Token]:
+        eof_pos, __ = yield from self._scan(src, 1, None, True)
+        yield Token.EOF(eof_pos)
 
+    def iter_lines(self, lines: Iterable[str]) -> Iterator[Token]:
+        # 巨大なファイル向け: 1行ずつ読み進めながら字句解析する (ソース全体をメモリに読み込まない)
+        # 範囲コメントや文字列が閉じていない行は、閉じるまで後続の行とまとめて字句解析する
+        lines = iter(lines)
+        row = 1
+        last_tag = None
+        eof_pos = TokenPosition(1, 1)
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            try:
+                tokens, state, error = _drain(self._scan(''.join(chunk), row, last_tag, False))
+            except _Incomplete:
+                # 追加する行数を倍々にして、長い範囲コメントでも字句解析のやり直しを線形時間に抑える
+                for __ in range(len(chunk)):
+                    if (line := next(lines, None)) is None:
+                        break
+                    chunk.append(line)
+                continue
+            # エラーの場合も、エラーの前までのトークンは生成する (iter_tokensと同じ)
+            yield from tokens
+            if error is not None:
+                raise error
+            eof_pos, last_tag = state
+            row = eof_pos.row
+            chunk = []
+
+        if chunk:
+            tokens, state, error = _drain(self._scan(''.join(chunk), row, last_tag, True))
+            yield from tokens
+            if error is not None:
+                raise error
+            eof_pos, last_tag = state
+        yield Token.EOF(eof_pos)
+
+    def _scan(self, src, row: int, last_tag, final: bool):
+        # srcを字句解析してトークンを生成し、(末尾の位置, 最後のトークンの種類) を返す (EOFは生成しない)
+        # finalがFalseの場合、閉じていない範囲コメント・文字列は_Incompleteとする
         i = 0
         n = len(src)
-        row = 1
         column_origin = 0
 
         def get_pos():
@@ -123,8 +215,9 @@ class Tokenizer():
                 i += 1
             elif c == '\n':
                 # 改行が連続する場合は1つまで追加する
-                if len(tokens) == 0 or tokens[-1].tag != Token.TokenType.NEWLINE:
-                    tokens.append(Token.Newline(get_pos()))
+                if last_tag != Token.TokenType.NEWLINE:
+                    last_tag = Token.TokenType.NEWLINE
+                    yield Token.Newline(get_pos())
 
                 i += 1
                 row += 1
@@ -139,99 +232,84 @@ class Tokenizer():
                     raise TokenizeError('missing LF', get_pos())
 
                 # 改行が連続する場合は1つまで追加する
-                if len(tokens) == 0 or tokens[-1].tag != Token.TokenType.NEWLINE:
-                    tokens.append(Token.Newline(get_pos()))
+                if last_tag != Token.TokenType.NEWLINE:
+                    last_tag = Token.TokenType.NEWLINE
+                    yield Token.Newline(get_pos())
 
                 i += 1
                 row += 1
                 column_origin = i
-            elif c == ';':
-                while i < n:
-                    c = src[i]
-                    if c == '\r' or c == '\n':
-                        break
-                    i += 1
-            elif c == '/' and i + 1 < n and src[i + 1] in ['/', '*']:
-                i += 1  # Skip '/'
-
-                if src[i] == '/':
-                    while i < n:
-                        c = src[i]
-                        if c == '\r' or c == '\n':
-                            break
-                        i += 1
-                else:
-                    i += 1  # Skip '*'
-                    if i >= n:
-                        raise TokenizeError('missing "*/"', get_pos())
-
-                    found = False
-                    while i < n:
-                        if src[i] == '*':
-                            i += 1  # Skip '*'
-                            if i >= n:
-                                break
-                            if src[i] == '/':
-                                i += 1  # Skip '/'
-                                found = True
-                                break
-                        elif src[i] in ['\r', '\n']:
-                            if src[i] == '\r':
-                                i += 1  # Skip '\r'
-                                if i >= n or src[i] != '\n':
-                                    raise TokenizeError('missing LF', get_pos())
-                            i += 1  # Skip '\n'
-                            row += 1
-                            column_origin = i
-                        else:
-                            i += 1
-
-                    if not found:
-                        raise TokenizeError('missing "*/"', get_pos())
+            elif c == ';' or src.startswith('//', i):
+                i = skip_line_comment(src, i)
+            elif src.startswith('/*', i):
+                end = skip_block_comment(src, i)
+                stop = n if end < 0 else end
+
+                # 範囲コメント内の改行
+                for m in NEWLINE_PATTERN.finditer(src, i + 2, stop):
+                    if m.group(0) == '\r':
+                        i = m.end()
+                        raise TokenizeError('missing LF', get_pos())
+                    row += 1
+                    column_origin = m.end()
+
+                i = stop
+                if end < 0:
+                    if not final:
+                        raise _Incomplete()
+                    raise TokenizeError('missing "*/"', get_pos())
             elif c == '"':
-                i += 1
-
-                s = None
-                j = i
-                while j < n:
-                    c = src[j]
-                    if c == '"':
-                        s = src[i:j]
-                        break
-                    if c == '\\':
-                        # Skip next char
-                        j += 1
-                    j += 1
-                if s is None:
+                pos = get_pos()
+                end = skip_str(src, i)
+                if end < 0:
+                    if not final:
+                        raise _Incomplete()
+                    i += 1
                     raise TokenizeError('tokenize: missing closing \'"\'', get_pos())
-                i = j + 1
-                tokens.append(Token.Str(get_pos(), s))
-            elif m := re.match(r'\d+', src[i:]):
+                s = src[i + 1:end - 1]
+                i = end
+                last_tag = Token.TokenType.STR
+                yield Token.Str(pos, s)
+            elif m := INT_PATTERN.match(src, i):
                 s = m.group(0)
                 if len(s) >= 2 and s[0] == '0':
                     raise TokenizeError(f'tokenize: invalid number \"{s}\"', get_pos())
-                tokens.append(Token.Int(get_pos(), s))
+                last_tag = Token.TokenType.INT
+                yield Token.Int(get_pos(), s)
                 i += len(s)
-            elif m := re.match(r'[_a-zA-Z]\w*', src[i:]):
+            elif m := ID_PATTERN.match(src, i):
                 s = m.group(0)
-                tokens.append(Token.Id(get_pos(), s))
+                last_tag = Token.TokenType.ID
+                yield Token.Id(get_pos(), s)
                 i += len(s)
             else:
                 found = False
                 for sign in self.SOME_CHARACTER_SIGNS:
-                    if src[i:i+len(sign)] == sign:
+                    if src.startswith(sign, i):
                         found = True
-                        tokens.append(Token.Sign(get_pos(), sign))
+                        last_tag = Token.TokenType.SIGN
+                        yield Token.Sign(get_pos(), sign)
                         i += len(sign)
                         break
 
                 if not found:
                     if c in self.ONE_CHARACTER_SIGNS:
-                        tokens.append(Token.Sign(get_pos(), c))
+                        last_tag = Token.TokenType.SIGN
+                        yield Token.Sign(get_pos(), c)
                         i += 1
                     else:
                         raise TokenizeError(f'tokenize: unknown char \'{c}\'', get_pos())
 
-        tokens.append(Token.EOF(get_pos()))
+        return get_pos(), last_tag
+
 
-        return tokens
+def _drain(tokens: Iterator[Token]):
+    # ジェネレータのトークンと戻り値(またはTokenizeError)をまとめて取り出す
+    result = []
+    while True:
+        try:
+            result.append(next(tokens))
+        except StopIteration as e:
+            return result, e.value, None
+        except TokenizeError as e:
+            return result, None, e
@@ -0,0 +1,438 @@
+import ast
+import re
+import sys
+import hashlib
+import threading
+from typing import Callable, Optional, TextIO
+from collections import OrderedDict
+from .tokenizer import Token, format_position
+from .parser import Node, Parser
+from .cfg import CALL_COMMANDS, EXIT_COMMANDS, JUMP_COMMANDS, RETURN_COMMANDS, ControlFlowGraph, \
+    stmt_def, stmt_uses
+
+
+NodeType = Node.NodeType
+
+# 式の型 (変数は、すべての代入が整数の式である場合のみINTとみなす)
+INT = 'int'
+STR = 'str'
+
+# 比較演算子 -> (Pythonの演算子, 整数以外の場合の実行時関数)
+COMPARE_OPS = {
+    NodeType.EQ_EXPR: ('==', '_eq'),
+    NodeType.NEQ_EXPR: ('!=', '_ne'),
+    NodeType.LT_EXPR: ('<', '_lt'),
+    NodeType.LTEQ_EXPR: ('<=', '_le'),
+    NodeType.GT_EXPR: ('>', '_gt'),
+    NodeType.GTEQ_EXPR: ('>=', '_ge'),
+}
+
+STR_ESCAPES = {'n': '\n', 't': '\t'}
+
+# CodeCacheに保持するProgramの数の既定値
+CODE_CACHE_SIZE = 256
+
+
+class TranspileError(Exception):
+    pass
+
+
+class ExecutionLimitError(Exception):
+    pass
+
+
+class Label():
+
+    # ラベルの値 (ラベル名で比較する)
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Label) and self.name == other.name
+
+    def __hash__(self) -> int:
+        return hash(self.name)
+
+    def __repr__(self) -> str:
+        return f'*{self.name}'
+
+
+# 実行時関数
+# HSPと同様に、右辺は左辺の型に変換してから演算する。整数の除算と剰余は0方向に切り捨てる
+
+def _to_int(v) -> int:
+    if isinstance(v, int):
+        return v
+    m = re.match(r'\s*[-+]?\d+', v)
+    return int(m.group(0)) if m else 0
+
+
+def _to_str(v) -> str:
+    return v if isinstance(v, str) else str(v)
+
+
+def _coerce(a, b):
+    return (a, _to_str(b)) if isinstance(a, str) else (a, _to_int(b))
+
+
+def _idiv(a: int, b: int) -> int:
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def _imod(a: int, b: int) -> int:
+    r = abs(a) % abs(b)
+    return -r if a < 0 else r
+
+
+def _add(a, b):
+    a, b = _coerce(a, b)
+    return a + b
+
+
+def _sub(a, b):
+    return _to_int(a) - _to_int(b)
+
+
+def _mul(a, b):
+    return _to_int(a) * _to_int(b)
+
+
+def _div(a, b):
+    return _idiv(_to_int(a), _to_int(b))
+
+
+def _mod(a, b):
+    return _imod(_to_int(a), _to_int(b))
+
+
+def _eq(a, b):
+    a, b = _coerce(a, b)
+    return 1 if a == b else 0
+
+
+def _ne(a, b):
+    a, b = _coerce(a, b)
+    return 1 if a != b else 0
+
+
+def _lt(a, b):
+    a, b = _coerce(a, b)
+    return 1 if a < b else 0
+
+
+def _le(a, b):
+    a, b = _coerce(a, b)
+    return 1 if a <= b else 0
+
+
+def _gt(a, b):
+    a, b = _coerce(a, b)
+    return 1 if a > b else 0
+
+
+def _ge(a, b):
+    a, b = _coerce(a, b)
+    return 1 if a >= b else 0
+
+
+def _return_without_gosub():
+    raise RuntimeError('return without gosub')
+
+
+def _jump(label_blocks: dict, target) -> int:
+    if not isinstance(target, Label) or target not in label_blocks:
+        raise RuntimeError(f'cannot jump to {target!r}')
+    return label_blocks[target]
+
+
+RUNTIME = {
+    '_to_int': _to_int,
+    '_to_str': _to_str,
+    '_idiv': _idiv,
+    '_imod': _imod,
+    '_add': _add,
+    '_sub': _sub,
+    '_mul': _mul,
+    '_div': _div,
+    '_mod': _mod,
+    '_eq': _eq,
+    '_ne': _ne,
+    '_lt': _lt,
+    '_le': _le,
+    '_gt': _gt,
+    '_ge': _ge,
+    '_return_without_gosub': _return_without_gosub,
+    '_jump': _jump,
+    'Label': Label,
+    'ExecutionLimitError': ExecutionLimitError,
+}
+
+
+def _var_name(name: str) -> str:
+    return f'v_{name}'
+
+
+def _command_name(name: str) -> str:
+    return f'c_{name}'
+
+
+def _decode_str(src: str) -> str:
+    # Tokenizerは文字列をエスケープしたまま保持している
+    return re.sub(r'\\(.)', lambda m: STR_ESCAPES.get(m.group(1), m.group(1)), src, flags=re.DOTALL)
+
+
+class _Translator():
+
+    def __init__(self, tree: Node):
+        self.cfg = ControlFlowGraph(tree)
+        self.var_types = {}
+        self.commands = set()
+        self._infer_var_types()
+
+    def _iter_assigns(self):
+        for stmt in self.cfg.stmts:
+            if stmt.tag == NodeType.ASSIGN_STMT:
+                yield stmt_def(stmt), stmt.child_nodes[1]
+
+    def _infer_var_types(self):
+        # 未代入の変数は0 (整数) なので、すべての変数を整数と仮定して不動点まで絞り込む
+        for stmt in self.cfg.stmts:
+            for name in stmt_uses(stmt):
+                self.var_types[name] = INT
+            if (name := stmt_def(stmt)) is not None:
+                self.var_types[name] = INT
+
+        changed = True
+        while changed:
+            changed = False
+            for name, expr in self._iter_assigns():
+                if self.var_types[name] == INT and self.expr(expr)[1] != INT:
+                    self.var_types[name] = None
+                    changed = True
+
+    def label_block(self, name: str, pos) -> int:
+        if name not in self.cfg.labels:
+            raise TranspileError(f'label "*{name}" is not defined (at {format_position(pos)})')
+        return self.cfg.labels[name]
+
+    def expr(self, node: Node):
+        # 戻り値: (Pythonの式, 型)
+        if node.tag == NodeType.ATOM:
+            tok = node.value
+            if tok.tag == Token.TokenType.ID:
+                return _var_name(tok.src), self.var_types.get(tok.src)
+            elif tok.tag == Token.TokenType.INT:
+                return tok.src, INT
+            else:
+                return repr(_decode_str(tok.src)), STR
+        elif node.tag == NodeType.LABEL_LITERAL:
+            tok = node.child_nodes[0].value
+            self.label_block(tok.src, tok.pos)
+            return f'Label({tok.src!r})', None
+
+        a, ta = self.expr(node.child_nodes[0])
+        b, tb = self.expr(node.child_nodes[1])
+        ints = ta == INT and tb == INT
+
+        if node.tag == NodeType.ADD_EXPR:
+            if ints:
+                return f'({a} + {b})', INT
+            if ta == STR:
+                return (f'({a} + {b})' if tb == STR else f'({a} + _to_str({b}))'), STR
+            return f'_add({a}, {b})', None
+        elif node.tag == NodeType.SUB_EXPR:
+            return (f'({a} - {b})' if ints else f'_sub({a}, {b})'), INT
+        elif node.tag == NodeType.MUL_EXPR:
+            return (f'({a} * {b})' if ints else f'_mul({a}, {b})'), INT
+        elif node.tag == NodeType.DIV_EXPR:
+            return (f'_idiv({a}, {b})' if ints else f'_div({a}, {b})'), INT
+        elif node.tag == NodeType.MOD_EXPR:
+            return (f'_imod({a}, {b})' if ints else f'_mod({a}, {b})'), INT
+        elif node.tag in COMPARE_OPS:
+            op, func = COMPARE_OPS[node.tag]
+            return (f'(1 if {a} {op} {b} else 0)' if ints else f'{func}({a}, {b})'), INT
+
+        raise TranspileError(f'unsupported expression "{node.tag_str()}"')
+
+    def block(self, index: int) -> list[str]:
+        cfg = self.cfg
+        block = cfg.blocks[index]
+        next_block = str(index + 1) if index + 1 < len(cfg.blocks) else 'None'
+
+        body = []
+        assigned = sorted({s.child_nodes[0].value.src for s in cfg.stmts[block.start:block.end]
+                           if s.tag == NodeType.ASSIGN_STMT})
+        if assigned:
+            body.append(f'global {", ".join(_var_name(v) for v in assigned)}')
+
+        ended = False
+        for stmt in cfg.stmts[block.start:block.end]:
+            if stmt.tag == NodeType.ASSIGN_STMT:
+                target, expr = stmt.child_nodes
+                body.append(f'{_var_name(target.value.src)} = {self.expr(expr)[0]}')
+            elif stmt.tag == NodeType.CALL_STMT:
+                func, args = stmt.child_nodes
+                name = func.value.src
+                if name.lower() in JUMP_COMMANDS | CALL_COMMANDS:
+                    if not args.child_nodes or args.child_nodes[0].tag == NodeType.DEFAULT:
+                        raise TranspileError(f'"{name}" requires a label (at {format_position(func.value.pos)})')
+                    target = args.child_nodes[0]
+                    if name.lower() in CALL_COMMANDS:
+                        body.append(f'_stack.append({next_block})')
+                    if target.tag == NodeType.LABEL_LITERAL:
+                        tok = target.child_nodes[0].value
+                        body.append(f'return {self.label_block(tok.src, tok.pos)}')
+                    else:
+                        # 変数経由の間接ジャンプ
+                        body.append(f'return _jump(_LABEL_BLOCKS, {self.expr(target)[0]})')
+                    ended = True
+                elif name.lower() in RETURN_COMMANDS:
+                    body.append('return _stack.pop() if _stack else _return_without_gosub()')
+                    ended = True
+                elif name.lower() in EXIT_COMMANDS:
+                    body.append('return None')
+                    ended = True
+                else:
+                    self.commands.add(name)
+                    values = [self.expr(a)[0] if a.tag != NodeType.DEFAULT else 'None'
+                              for a in args.child_nodes]
+                    body.append(f'{_command_name(name)}({", ".join(values)})')
+        if not ended:
+            body.append(f'return {next_block}')
+
+        return [f'def _b{index}():', *(f'    {line}' for line in body), '']
+
+    def module(self) -> str:
+        lines = ['_stack = []']
+        lines.extend(f'{_var_name(v)} = 0' for v in sorted(self.var_types))
+        lines.append('')
+        for block in self.cfg.blocks:
+            lines.extend(self.block(block.index))
+        lines.append(f'_BLOCKS = [{", ".join(f"_b{b.index}" for b in self.cfg.blocks)}]')
+        lines.append(f'_LABEL_BLOCKS = {{{", ".join(f"Label({name!r}): {b}" for name, b in self.cfg.labels.items())}}}')
+        lines.extend([
+            '',
+            'def _run(max_steps=None):',
+            '    blocks = _BLOCKS',
+            '    pc = 0 if blocks else None',
+            '    if max_steps is None:',
+            '        while pc is not None:',
+            '            pc = blocks[pc]()',
+            '    else:',
+            '        for __ in range(max_steps):',
+            '            if pc is None:',
+            '                return',
+            '            pc = blocks[pc]()',
+            '        if pc is not None:',
+            '            raise ExecutionLimitError(f"not finished in {max_steps} steps")',
+            '',
+        ])
+        return '\n'.join(lines)
+
+
+def to_python_source(tree: Node) -> str:
+    # ラベルで区切られた基本ブロックを関数にし、関数が返す次のブロックの番号で実行を続ける
+    # goto/gosub/returnは次のブロックの番号を返す (gosubは戻り先をスタックに積む)
+    # ラベルの値はLabelで、変数経由のジャンプは_LABEL_BLOCKSでブロックの番号に変換する
+    return _Translator(tree).module()
+
+
+def to_python_ast(tree: Node) -> ast.Module:
+    return ast.parse(to_python_source(tree))
+
+
+def default_commands(stdout: Optional[TextIO] = None) -> dict:
+    def mes(value=None, *args):
+        print('' if value is None else _to_str(value), file=stdout if stdout is not None else sys.stdout)
+    return {'mes': mes}
+
+
+class Program():
+
+    def __init__(self, code, source: str, commands: frozenset):
+        self.code = code
+        self.source = source
+        self.commands = commands
+
+    def run(self, commands: Optional[dict[str, Callable]] = None, stdout: Optional[TextIO] = None,
+            max_steps: Optional[int] = None) -> dict:
+        # commands: 命令名 -> 関数 (省略した引数にはNoneが渡される)
+        # 戻り値: 変数名 -> 終了時の値
+        # max_steps: 実行するブロック数の上限 (超えるとExecutionLimitError)
+        commands = {**default_commands(stdout), **(commands or {})}
+        namespace = dict(RUNTIME)
+        for name in self.commands:
+            if name not in commands:
+                raise TranspileError(f'command "{name}" is not defined')
+            namespace[_command_name(name)] = commands[name]
+
+        exec(self.code, namespace)
+        namespace['_run'](max_steps)
+        return {k[2:]: v for k, v in namespace.items() if k.startswith('v_')}
+
+
+class CodeCache():
+
+    # ソースのハッシュ -> Program
+    # 複数のスレッドで共有できるよう、ロックで保護する
+    # maxsizeを超えたら、最も長く使われていないものから捨てる
+
+    def __init__(self, maxsize: int = CODE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._programs = OrderedDict()
+
+    def get(self, key: str) -> Optional[Program]:
+        with self._lock:
+            program = self._programs.get(key)
+            if program is not None:
+                self._programs.move_to_end(key)
+            return program
+
+    def set(self, key: str, program: Program):
+        with self._lock:
+            self._programs[key] = program
+            self._programs.move_to_end(key)
+            while len(self._programs) > self.maxsize:
+                self._programs.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._programs)
+
+
+_DEFAULT_CACHE = CodeCache()
+
+
+def _hash(kind: str, src: str) -> str:
+    return f'{kind}:{hashlib.sha256(src.encode()).hexdigest()}'
+
+
+def compile_tree(tree: Node, cache: Optional[CodeCache] = None) -> Program:
+    cache = cache if cache is not None else _DEFAULT_CACHE
+    translator = _Translator(tree)
+    source = translator.module()
+    key = _hash('py', source)
+    if (program := cache.get(key)) is None:
+        program = Program(compile(source, '<hsp>', 'exec'), source, frozenset(translator.commands))
+        cache.set(key, program)
+    return program
+
+
+def compile_str(src: str, cache: Optional[CodeCache] = None, parser: Optional[Parser] = None) -> Program:
+    # HSPのソースが同じなら、構文解析と変換も省略する
+    # ただし#includeしたファイルは変わりうるので、プリプロセッサ命令(#)を含むソースは毎回構文解析する
+    # (変換後のPythonのソースが同じなら、compile_treeでコンパイルは省略される)
+    cache = cache if cache is not None else _DEFAULT_CACHE
+    key = _hash('hsp', src) if '#' not in src else None
+    if key is not None and (program := cache.get(key)) is not None:
+        return program
+
+    parser = parser if parser is not None else Parser(debug=False)
+    program = compile_tree(parser.parse_str(src), cache)
+    if key is not None:
+        cache.set(key, program)
+    return program
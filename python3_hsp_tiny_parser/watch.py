@@ -0,0 +1,116 @@
+import os
+import time
+from typing import Callable, Iterable, Optional, Union
+from pathlib import Path
+from .parser import Parser
+from .lint import Diagnostic, Linter, SYNTAX_ERRORS, parse_error_diagnostic
+
+
+# 構文解析するファイルと、変更を監視するだけのファイル(インクルードされるヘッダ)
+SRC_SUFFIXES = ('.hsp',)
+HEADER_SUFFIXES = ('.as',)
+
+# 監視を続けられるよう、構文エラーと同様に報告するエラー
+# (CP932として読めないファイルや、scan()の後にエディタが削除・置き換えたファイル)
+READ_ERRORS = (OSError, UnicodeDecodeError)
+
+
+def _scan(paths: Iterable[Path], snapshot: dict):
+    # 各ファイルの (mtime, size) を集める (statのみで、ファイルは読まない)
+    for path in paths:
+        if path.is_dir():
+            with os.scandir(path) as it:
+                entries = list(it)
+            _scan((Path(e.path) for e in entries
+                   if e.is_dir() or e.name.endswith(SRC_SUFFIXES + HEADER_SUFFIXES)), snapshot)
+        else:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path.resolve()] = (st.st_mtime_ns, st.st_size)
+
+
+class Watcher():
+
+    def __init__(self, paths: Iterable[Union[Path, str]], linter: Optional[Linter] = None,
+                 parser: Optional[Parser] = None,
+                 report: Optional[Callable[[list[Diagnostic], list[Diagnostic]], None]] = None):
+        self.paths = [Path(p) for p in paths]
+        self.linter = linter if linter is not None else Linter()
+        self.parser = parser if parser is not None else Parser(debug=False)
+        self.report = report
+        self.snapshot = {}
+        self.asts = {}
+        self.diagnostics = {}
+
+    def scan(self) -> set[Path]:
+        snapshot = {}
+        _scan(self.paths, snapshot)
+        changed = {p for p in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(p) != self.snapshot.get(p)}
+        self.snapshot = snapshot
+        return changed
+
+    def update(self, changed: set[Path]) -> tuple[list[Diagnostic], list[Diagnostic]]:
+        # 変更されたファイル(と、変更されたヘッダをインクルードしているファイル)だけを再解析する
+        targets = set()
+        cache = self.parser.preprocessor.cache
+        for path in changed:
+            # IncludeCacheはmtimeのみで更新を判定するので、同じmtimeのまま書き換えられた場合に備えて破棄する
+            cache.invalidate(path)
+            if path.suffix in SRC_SUFFIXES:
+                targets.add(path)
+            # インクルードしているヘッダ自体は単体では解析しない
+            targets.update(p for p in cache.dependents(path)
+                           if p in self.snapshot and p.suffix in SRC_SUFFIXES)
+
+        new = []
+        resolved = []
+        for path in sorted(targets):
+            old = self.diagnostics.pop(path, [])
+            self.asts.pop(path, None)
+
+            current = []
+            if path in self.snapshot:
+                try:
+                    ast = self.parser.parse_file(path)
+                except SYNTAX_ERRORS + READ_ERRORS as e:
+                    current = [parse_error_diagnostic(path, e)]
+                else:
+                    self.asts[path] = ast
+                    current = self.linter.lint_tree(ast, path).diagnostics
+                self.diagnostics[path] = current
+
+            new.extend(d for d in current if d not in old)
+            resolved.extend(d for d in old if d not in current)
+
+        if self.report is not None and (new or resolved):
+            self.report(new, resolved)
+        return new, resolved
+
+    def poll(self) -> tuple[list[Diagnostic], list[Diagnostic]]:
+        return self.update(self.scan())
+
+    def run(self, interval: float = 1.0, debounce: float = 0.3, max_polls: Optional[int] = None):
+        # 初回はすべてのファイルを解析する
+        self.poll()
+
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            time.sleep(interval)
+            polls += 1
+
+            changed = self.scan()
+            if not changed:
+                continue
+
+            # 連続した変更は、debounce秒間変更がなくなるまでまとめる
+            while True:
+                time.sleep(debounce)
+                more = self.scan()
+                if not more:
+                    break
+                changed |= more
+
+            self.update(changed)
@@ -0,0 +1,59 @@
+import threading
+from python3_hsp_tiny_parser.lint import PARSE_ERROR_RULE
+from python3_hsp_tiny_parser.parser import Parser
+from python3_hsp_tiny_parser.batch import parse_many
+
+
+def test_results_are_in_order():
+    sources = [f'x = {i}\nmes x\n' for i in range(50)]
+    sources[7] = 'x = = 1\n'
+    results = parse_many(sources, max_workers=4)
+
+    assert len(results) == 50
+    assert results[7].ast is None
+    assert results[7].diagnostic.rule == PARSE_ERROR_RULE
+    assert results[7].diagnostic.srcfile == '<source 7>'
+    for i, result in enumerate(results):
+        if i != 7:
+            assert result.diagnostic is None
+            assert result.ast == Parser(debug=False).parse_str(sources[i])
+
+
+def test_files_share_include_cache(tmp_path):
+    (tmp_path / 'common.as').write_text('#const N 3\n', encoding='CP932')
+    paths = []
+    for i in range(20):
+        path = tmp_path / f'{i}.hsp'
+        path.write_text(f'#include "common.as"\nmes N + {i}\n', encoding='CP932')
+        paths.append(path)
+
+    parser = Parser(debug=False)
+    results = parse_many(paths, max_workers=8, parser=parser)
+    assert all(r.diagnostic is None for r in results)
+    assert results[5].ast == parser.parse_str('mes 3 + 5\n')
+    assert parser.preprocessor.cache.dependents((tmp_path / 'common.as').resolve()) \
+        == {p.resolve() for p in paths}
+
+
+def test_shared_parser_from_threads():
+    parser = Parser(debug=False)
+    src = ''.join(f'*l{i}\nv{i} = {i} * (2 + {i}) \\ 3 < 4\ngoto *l{i}\n' for i in range(100))
+    expected = parser.parse_str(src)
+    results = []
+
+    def work():
+        for __ in range(5):
+            results.append(parser.parse_str(src))
+
+    threads = [threading.Thread(target=work) for __ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 20 and all(ast == expected for ast in results)
+
+
+def test_sequential():
+    assert parse_many([]) == []
+    [result] = parse_many(['mes 1\n'], max_workers=1)
+    assert result.ast == Parser(debug=False).parse_str('mes 1\n')
@@ -0,0 +1,107 @@
+from python3_hsp_tiny_parser.parser import Parser
+from python3_hsp_tiny_parser.cfg import ControlFlowGraph, LiveVariables, Reachability, ReachingDefinitions
+
+
+def build(src):
+    return ControlFlowGraph(Parser(debug=False).parse_str(src))
+
+
+def test_empty():
+    cfg = build('')
+    assert cfg.blocks == []
+    assert Reachability(cfg).unreachable_stmts() == []
+
+
+def test_blocks():
+    cfg = build('x = 1\n*a\nmes x\ngoto *a\nmes 2\n')
+    assert [(b.start, b.end) for b in cfg.blocks] == [(0, 1), (1, 4), (4, 5)]
+    assert [b.succs for b in cfg.blocks] == [[1], [1], []]
+    assert [b.preds for b in cfg.blocks] == [[], [0, 1], []]
+
+
+def test_unreachable_after_goto_and_end():
+    src = '''goto *main
+mes "dead"
+*main
+mes "a"
+end
+mes "dead"
+*unused
+mes "dead"
+'''
+    cfg = build(src)
+    assert Reachability(cfg).unreachable_stmts() == [1, 5, 6, 7]
+
+
+def test_gosub_and_return():
+    src = '''gosub *sub
+mes "after"
+end
+*sub
+mes "sub"
+return
+'''
+    cfg = build(src)
+    reach = Reachability(cfg)
+    assert reach.unreachable_stmts() == []
+    assert cfg.blocks[cfg.block_of[5]].succs == [cfg.block_of[1]]
+
+
+def test_indirect_goto_targets_escaped_labels():
+    src = '''*main
+sub_ = *sub
+goto sub_
+*sub
+end
+*other
+end
+'''
+    cfg = build(src)
+    assert Reachability(cfg).unreachable_stmts() == [5, 6]
+    assert cfg.blocks[cfg.block_of[2]].succs == [cfg.block_of[3]]
+
+
+def test_live_variables():
+    src = '''x = 1
+y = 2
+mes x
+*loop
+z = y + 1
+y = z
+goto *loop
+'''
+    cfg = build(src)
+    live = LiveVariables(cfg)
+    assert live.live_in(0) == set()
+    assert live.live_out(0) == {'x'}
+    assert live.live_in(2) == {'x', 'y'}
+    assert live.live_out(2) == {'y'}
+    assert live.live_in(cfg.stmts[4]) == {'y'}
+    assert live.live_out(5) == {'y'}
+
+
+def test_reaching_definitions():
+    src = '''x = 1
+*loop
+mes x
+x = x + 1
+y = x
+goto *loop
+'''
+    cfg = build(src)
+    rd = ReachingDefinitions(cfg)
+    assert rd.reaching(2) == [0, 3, 4]
+    assert rd.reaching_var(2, 'x') == [0, 3]
+    assert rd.reaching_var(4, 'x') == [3]
+
+
+def test_large_program():
+    lines = []
+    for i in range(3000):
+        lines.append(f'*l{i}\nv{i % 50} = v{(i + 1) % 50} + {i}\ngoto *l{i + 1}\n')
+    lines.append('*l3000\nend\n')
+    cfg = build(''.join(lines))
+    assert Reachability(cfg).unreachable_stmts() == []
+    live = LiveVariables(cfg)
+    assert 'v1' in live.live_in(0)
+    assert ReachingDefinitions(cfg).reaching(len(cfg.stmts) - 1)
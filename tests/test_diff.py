@@ -0,0 +1,79 @@
+import pytest
+from python3_hsp_tiny_parser.tokenizer import TokenPosition
+from python3_hsp_tiny_parser.parser import Node, Parser
+from python3_hsp_tiny_parser.diff import DELETE, INSERT, MODIFY, MOVE, diff_nodes, diff_trees, format_change, match_stmts
+
+
+@pytest.fixture
+def parser():
+    return Parser(debug=False)
+
+
+def kinds(changes):
+    return [(c.kind, c.old_pos and c.old_pos.row, c.new_pos and c.new_pos.row) for c in changes]
+
+
+def test_no_changes(parser):
+    a = parser.parse_str('x = 1\nmes x\n')
+    b = parser.parse_str('\nx = 1\n\nmes x\n')
+    assert diff_trees(a, b) == []
+
+
+def test_insert_and_delete(parser):
+    a = parser.parse_str('x = 1\ny = 2\nmes x\n')
+    b = parser.parse_str('x = 1\nmes x\nmes "new"\n')
+    assert kinds(diff_trees(a, b)) == [(DELETE, 2, None), (INSERT, None, 3)]
+
+
+def test_modify_reports_subexpressions(parser):
+    a = parser.parse_str('x = a * 2 + b\n')
+    b = parser.parse_str('x = a * 3 + b\n')
+    changes = diff_trees(a, b)
+    assert kinds(changes) == [(MODIFY, 1, 1)]
+    [detail] = changes[0].details
+    assert detail.old_pos == TokenPosition(1, 9)
+    assert detail.old.value.src == '2' and detail.new.value.src == '3'
+
+
+def test_move(parser):
+    a = parser.parse_str('a = 1\nb = 2\nc = 3\nd = 4\n')
+    b = parser.parse_str('b = 2\nc = 3\nd = 4\na = 1\n')
+    assert kinds(diff_trees(a, b)) == [(MOVE, 1, 4)]
+
+
+def test_duplicate_stmts(parser):
+    a = parser.parse_str('mes 1\nmes 1\nmes 2\nmes 1\n')
+    b = parser.parse_str('mes 1\nmes 2\nmes 1\nmes 1\n')
+    changes = diff_trees(a, b)
+    assert all(c.kind in (MOVE, INSERT, DELETE) for c in changes)
+    assert len(changes) <= 2
+
+
+def test_match_stmts_anchors_on_unique_stmts(parser):
+    a = parser.parse_str('*a\nx = 1\n*b\ny = 1\n*c\n').child_nodes
+    b = parser.parse_str('*a\nx = 2\n*b\ny = 2\n*c\n').child_nodes
+    assert match_stmts(list(a), list(b)) == [(0, 0), (2, 2), (4, 4)]
+
+
+def test_diff_nodes(parser):
+    a = parser.parse_str('x 1, 2\n').child_nodes[0]
+    b = parser.parse_str('x 1, 2, 3\n').child_nodes[0]
+    [change] = diff_nodes(a, b)
+    assert change.old.tag == Node.NodeType.ARGS
+
+
+def test_large_diff_is_fast(parser):
+    src = ''.join(f'v{i} = {i} + 1\n' for i in range(2000))
+    a = parser.parse_str(src)
+    b = parser.parse_str(src.replace('v1000 = 1000 + 1', 'v1000 = 1000 + 2'))
+    changes = diff_trees(a, b)
+    assert kinds(changes) == [(MODIFY, 1001, 1001)]
+
+
+def test_format_change(parser):
+    a = parser.parse_str('x = 1 + 2\n')
+    b = parser.parse_str('x = 1 + 3\nmes x\n')
+    assert [format_change(c) for c in diff_trees(a, b)] == [
+        '~ 1:1 -> 1:1: x = 1 + 2  =>  x = 1 + 3\n    1:9 -> 1:9: 2  =>  3',
+        '+ 2:1: mes x',
+    ]
@@ -0,0 +1,47 @@
+import pytest
+from python3_hsp_tiny_parser.tokenizer import TokenPosition
+from python3_hsp_tiny_parser.parser import Node, Parser
+from python3_hsp_tiny_parser.duplicates import find_duplicates
+
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def test_no_duplicates(parser):
+    ast = parser.parse_str('a = 1 + 2\nb = 3 + 4\n')
+    assert find_duplicates([('a.hsp', ast)]) == []
+
+
+def test_duplicate_stmts_across_files(parser):
+    a = parser.parse_str('x = 1\nmes "a" + x\n')
+    b = parser.parse_str('y = 2\n\nmes "a" + x\n')
+    groups = find_duplicates([('a.hsp', a), ('b.hsp', b)])
+    assert len(groups) == 1
+    assert [(loc.srcfile, loc.pos) for loc in groups[0]] == [
+        ('a.hsp', TokenPosition(2, 1)),
+        ('b.hsp', TokenPosition(3, 1)),
+    ]
+
+
+def test_duplicate_exprs(parser):
+    ast = parser.parse_str('a = x * 2 + 1\nb = x * 2 + 1 - y\n')
+    groups = find_duplicates([('a.hsp', ast)])
+    assert len(groups) == 1
+    assert groups[0][0].node == groups[0][1].node
+    assert groups[0][0].node.tag == Node.NodeType.ADD_EXPR
+    assert groups[0][0].node.size == 5
+
+
+def test_nested_duplicates_are_not_reported(parser):
+    ast = parser.parse_str('a = x * 2 + 1\na = x * 2 + 1\n')
+    groups = find_duplicates([('a.hsp', ast)])
+    assert len(groups) == 1
+    assert groups[0][0].node.tag == Node.NodeType.ASSIGN_STMT
+
+
+def test_min_size(parser):
+    ast = parser.parse_str('a = 1\na = 1\n')
+    assert find_duplicates([('a.hsp', ast)], min_size=4) == []
+    assert len(find_duplicates([('a.hsp', ast)], min_size=3)) == 1
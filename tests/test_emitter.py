@@ -0,0 +1,89 @@
+import io
+import pytest
+from pathlib import Path
+from python3_hsp_tiny_parser.tokenizer import TokenPosition, Token
+from python3_hsp_tiny_parser.parser import Node, Parser
+from python3_hsp_tiny_parser.emitter import EmitError, Emitter, to_source
+
+
+Id = Token.Id
+Int = Token.Int
+
+Stmts = Node.Stmts
+CallStmt = Node.CallStmt
+Args = Node.Args
+Default = Node.Default
+AddExpr = Node.AddExpr
+SubExpr = Node.SubExpr
+MulExpr = Node.MulExpr
+LabelLiteral = Node.LabelLiteral
+Atom = Node.Atom
+
+POS = TokenPosition(1, 1)
+
+INPUTS_DIR = Path(__file__).parent.parent / 'inputs'
+ROUND_TRIP_INPUTS = ['call', 'comment', 'hello', 'label', 'op_comp', 'op_mul', 'op_sum']
+
+
+def atom(src):
+    return Atom(value=Int(POS, src) if src.isdigit() else Id(POS, src))
+
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+@pytest.mark.parametrize('src', [
+    '*main\n',
+    'x = 1\n',
+    's = "a\\"b"\n',
+    'a\n',
+    'a 1, 2\n',
+    'b ,\n',
+    'c 1,\n',
+    'd , 2\n',
+    'e ,, 3\n',
+    'goto *main\n',
+    'x = 1 + 2 * 3\n',
+    'x = (1 + 2) * 3\n',
+    'x = 1 - (2 - 3)\n',
+    'x = 1 - 2 - 3\n',
+    'x = (1 == 2) + 1\n',
+    'x = 1 < 2 == 1\n',
+])
+def test_emit_is_canonical(parser, src):
+    assert to_source(parser.parse_str(src)) == src
+
+
+@pytest.mark.parametrize('node, expected', [
+    (SubExpr(atom('1'), SubExpr(atom('2'), atom('3'))), '1 - (2 - 3)'),
+    (SubExpr(SubExpr(atom('1'), atom('2')), atom('3')), '1 - 2 - 3'),
+    (MulExpr(AddExpr(atom('a'), atom('b')), atom('c')), '(a + b) * c'),
+    (AddExpr(atom('a'), MulExpr(atom('b'), atom('c'))), 'a + b * c'),
+])
+def test_minimal_parens(node, expected):
+    stream = io.StringIO()
+    Emitter(stream).emit_expr(node)
+    assert stream.getvalue() == expected
+
+
+def test_indent(parser):
+    ast = parser.parse_str('*main\nmes 1\n')
+    assert to_source(ast, indent='\t') == '*main\n\tmes 1\n'
+
+
+@pytest.mark.parametrize('node', [
+    Stmts(CallStmt(atom('x'), Args(Default()))),
+    Stmts(CallStmt(atom('x'), Args(AddExpr(LabelLiteral(atom('a')), atom('1'))))),
+    Stmts(atom('x')),
+])
+def test_unemittable(node):
+    with pytest.raises(EmitError):
+        to_source(node)
+
+
+@pytest.mark.parametrize('name', ROUND_TRIP_INPUTS)
+def test_round_trip_inputs(parser, name):
+    ast = parser.parse_file(INPUTS_DIR / f'{name}.hsp')
+    assert parser.parse_str(to_source(ast)) == ast
@@ -0,0 +1,80 @@
+import io
+import json
+import pytest
+from python3_hsp_tiny_parser.parser import Node, Parser
+from python3_hsp_tiny_parser.json_export import write_json, write_ndjson
+
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def test_write_json(parser):
+    ast = parser.parse_str('x = 1 + y\n')
+    stream = io.StringIO()
+    write_json(ast, stream)
+    assert json.loads(stream.getvalue()) == {
+        'tag': 'Stmts', 'type': 'STMTS', 'children': [
+            {'tag': '=', 'type': 'ASSIGN_STMT', 'children': [
+                {'tag': 'Atom', 'type': 'ATOM', 'token': {'kind': 'ID', 'src': 'x', 'row': 1, 'column': 1}},
+                {'tag': '+', 'type': 'ADD_EXPR', 'children': [
+                    {'tag': 'Atom', 'type': 'ATOM', 'token': {'kind': 'INT', 'src': '1', 'row': 1, 'column': 5}},
+                    {'tag': 'Atom', 'type': 'ATOM', 'token': {'kind': 'ID', 'src': 'y', 'row': 1, 'column': 9}},
+                ]},
+            ]},
+        ]}
+
+
+def test_write_json_escapes_str(parser):
+    ast = parser.parse_str('mes "a\\"b"\n')
+    stream = io.StringIO()
+    write_json(ast, stream)
+    call = json.loads(stream.getvalue())['children'][0]
+    arg = call['children'][1]['children'][0]
+    assert arg['token'] == {'kind': 'STR', 'src': 'a\\"b', 'row': 1, 'column': 5}
+
+
+def test_write_json_srcfile(parser, tmp_path):
+    common = tmp_path / 'common.as'
+    common.write_text('x = 1\n', encoding='CP932')
+    main = tmp_path / 'main.hsp'
+    main.write_text('#include "common.as"\nmes x\n', encoding='CP932')
+    stream = io.StringIO()
+    write_json(parser.parse_file(main), stream)
+    assign, call = json.loads(stream.getvalue())['children']
+    assert assign['children'][0]['token'] == {
+        'kind': 'ID', 'src': 'x', 'row': 1, 'column': 1, 'srcfile': str(common.resolve())}
+    assert 'srcfile' not in call['children'][0]['token']
+
+
+def test_write_json_default(parser):
+    ast = parser.parse_str('x ,\n')
+    stream = io.StringIO()
+    write_json(ast, stream)
+    args = json.loads(stream.getvalue())['children'][0]['children'][1]
+    assert args['children'] == [{'tag': 'Default', 'type': 'DEFAULT', 'children': []}] * 2
+
+
+def test_write_ndjson_streams_stmts(parser, tmp_path):
+    srcfile = tmp_path / 'a.hsp'
+    srcfile.write_text('*main\nx = 1\n\nmes x\n', encoding='CP932')
+    stream = io.StringIO()
+    write_ndjson(parser.iter_file(srcfile), stream)
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line)['type'] for line in lines] == ['LABEL_STMT', 'ASSIGN_STMT', 'CALL_STMT']
+
+
+def test_iter_file_is_lazy(parser, tmp_path):
+    srcfile = tmp_path / 'a.hsp'
+    srcfile.write_text('x = 1\n)\n', encoding='CP932')
+    stmts = parser.iter_file(srcfile)
+    assert next(stmts).tag == Node.NodeType.ASSIGN_STMT
+
+
+def test_iter_file_matches_parse_file(parser, tmp_path):
+    srcfile = tmp_path / 'a.hsp'
+    srcfile.write_text('x = 1\n/* a\nb */ mes "c\nd"\n' + 'mes x\n' * 1000, encoding='CP932')
+    stmts = list(parser.iter_file(srcfile))
+    assert stmts == list(Parser(debug=False).parse_file(srcfile).child_nodes)
+    assert len(stmts) == 1002
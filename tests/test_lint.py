@@ -0,0 +1,107 @@
+import pytest
+from python3_hsp_tiny_parser.tokenizer import TokenPosition
+from python3_hsp_tiny_parser.parser import Node, Parser
+from python3_hsp_tiny_parser.lint import (
+    DEFAULT_RULES, PARSE_ERROR_RULE, Diagnostic, Linter, Rule, format_diagnostic,
+    DivisionByZeroRule, TooManyDefaultsRule, UndefinedLabelRule, UnusedVariableRule)
+
+
+def lint(src, rules=DEFAULT_RULES):
+    ast = Parser(debug=False).parse_str(src)
+    return Linter(rules).lint_tree(ast, 'a.hsp')
+
+
+def found(src, rule):
+    return [(d.pos, d.rule) for d in lint(src, [rule]).diagnostics]
+
+
+def test_undefined_label():
+    src = '*main\ngoto *main\ngoto *sub\nx = *missing\n'
+    assert found(src, UndefinedLabelRule) == [
+        (TokenPosition(3, 7), 'undefined-label'),
+        (TokenPosition(4, 6), 'undefined-label'),
+    ]
+
+
+def test_label_defined_after_reference():
+    assert found('goto *sub\n*sub\n', UndefinedLabelRule) == []
+
+
+def test_unused_variable():
+    src = 'x = 1\ny = 2\nmes y\nz = 3\nz = z + 1\n'
+    assert found(src, UnusedVariableRule) == [(TokenPosition(1, 1), 'unused-variable')]
+
+
+def test_command_and_label_names_are_not_reads():
+    src = 'mes = 1\nmes\nsub = 1\n*sub\ngoto *sub\n'
+    assert len(found(src, UnusedVariableRule)) == 2
+
+
+@pytest.mark.parametrize('src, count', [
+    ('a 1, 2\n', 0),
+    ('c 1,\n', 0),
+    ('b ,\n', 1),
+    ('e , , 3\n', 0),
+    ('e , , , 4\n', 1),
+])
+def test_too_many_defaults(src, count):
+    assert len(found(src, TooManyDefaultsRule)) == count
+
+
+@pytest.mark.parametrize('src, count', [
+    ('x = 1 / 0\n', 1),
+    ('x = 1 \\ 0\n', 1),
+    ('x = 1 / 2\n', 0),
+    ('x = 0 / y\n', 0),
+    ('x = 1 * 0\n', 0),
+])
+def test_division_by_zero(src, count):
+    assert len(found(src, DivisionByZeroRule)) == count
+
+
+def test_rules_are_fused_into_one_traversal():
+    visited = []
+
+    class CountingRule(Rule):
+        name = 'counting'
+        tags = (Node.NodeType.ATOM,)
+
+        def visit(self, node, parent):
+            visited.append(node)
+
+    result = lint('x = 1 / 0\n', [CountingRule, DivisionByZeroRule])
+    assert len(visited) == 3
+    assert set(result.costs) == {'counting', 'division-by-zero'}
+    assert all(cost >= 0 for cost in result.costs.values())
+
+
+def test_format_diagnostic():
+    d = Diagnostic('a.hsp', TokenPosition(1, 2), 'rule', 'message')
+    assert format_diagnostic(d) == 'a.hsp:1:2: rule: message'
+
+
+def test_diagnostic_in_included_file(tmp_path):
+    b = tmp_path / 'b.as'
+    m = tmp_path / 'm.hsp'
+    b.write_text('x = 1\nz = 2\n', encoding='CP932')
+    m.write_text('#include "b.as"\nmes x\n', encoding='CP932')
+    result = Linter([UnusedVariableRule]).lint_file(m)
+    assert [format_diagnostic(d) for d in result.diagnostics] == [
+        f'{b.resolve()}:2:1: unused-variable: variable "z" is assigned but never read']
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_lint_files(tmp_path, jobs):
+    a = tmp_path / 'a.hsp'
+    b = tmp_path / 'b.hsp'
+    c = tmp_path / 'c.hsp'
+    a.write_text('x = 1 / 0\nmes x\n', encoding='CP932')
+    b.write_text('goto *sub\n', encoding='CP932')
+    c.write_text('x = (\n', encoding='CP932')
+    result = Linter().lint_files([a, b, c], jobs=jobs)
+    assert [(d.srcfile, d.rule) for d in result.diagnostics] == [
+        (a, 'division-by-zero'),
+        (b, 'undefined-label'),
+        (c, PARSE_ERROR_RULE),
+    ]
+    assert set(result.costs) == {rule.name for rule in DEFAULT_RULES}
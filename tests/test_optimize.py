@@ -0,0 +1,94 @@
+import pytest
+from pathlib import Path
+from python3_hsp_tiny_parser.parser import Parser
+from python3_hsp_tiny_parser.emitter import to_source
+from python3_hsp_tiny_parser.optimize import VerificationError, optimize, run_behavior, verify_equivalent
+
+
+INPUTS_DIR = Path(__file__).parent.parent / 'inputs'
+
+
+@pytest.fixture
+def parser():
+    return Parser(debug=False)
+
+
+def test_unreachable_after_jumps(parser):
+    tree = parser.parse_str('mes 1\ngoto *a\nmes 2\nx = 3\n*a\nmes 4\nend\nmes 5\n')
+    result = optimize(tree, verify=True)
+    assert to_source(result.tree) == 'mes 1\ngoto *a\n*a\nmes 4\nend\n'
+    assert result.removed_stmts == 3
+    assert result.removed_nodes == tree.size - result.tree.size == 11
+
+
+def test_unreferenced_labels(parser):
+    result = optimize(parser.parse_str('*main\nmes 1\n*unused\nmes 2\n'), verify=True)
+    assert to_source(result.tree) == 'mes 1\nmes 2\n'
+    assert result.removed_stmts == 2
+
+
+def test_goto_chain(parser):
+    src = ('gosub *a\n'
+           'l = *b\n'
+           'goto l\n'
+           '*a\n'
+           '*a2\n'
+           'goto *b\n'
+           '*b\n'
+           'goto *c\n'
+           '*c\n'
+           'mes "c"\n'
+           'return\n')
+    result = optimize(parser.parse_str(src), verify=True)
+    assert to_source(result.tree) == ('gosub *c\n'
+                                      'l = *b\n'
+                                      'goto l\n'
+                                      '*b\n'
+                                      'goto *c\n'
+                                      '*c\n'
+                                      'mes "c"\n'
+                                      'return\n')
+    assert result.retargeted == 2
+
+
+def test_cyclic_goto_chain_is_kept(parser):
+    tree = parser.parse_str('goto *a\n*a\ngoto *b\n*b\ngoto *a\n')
+    result = optimize(tree, verify=True, max_steps=50)
+    assert result.tree == tree
+    assert result.removed_nodes == 0 and result.retargeted == 0
+
+
+def test_escaped_labels_are_kept(parser):
+    src = 'onclick *handler\nstop\n*handler\nmes 1\nreturn\n'
+    result = optimize(parser.parse_str(src), verify=True)
+    assert to_source(result.tree) == 'onclick *handler\nstop\n*handler\nmes 1\nreturn\n'
+
+
+def test_dead_subroutine_is_removed(parser):
+    src = 'mes 1\nend\n*sub\nmes 2\nreturn\n*sub2\ngoto *sub\n'
+    result = optimize(parser.parse_str(src), verify=True)
+    assert to_source(result.tree) == 'mes 1\nend\n'
+
+
+def test_verify_detects_changes(parser):
+    original = parser.parse_str('mes 1\nx = 2\n')
+    verify_equivalent(original, parser.parse_str('mes 1\nx = 2\n'))
+    with pytest.raises(VerificationError):
+        verify_equivalent(original, parser.parse_str('mes 1\nx = 3\n'))
+    with pytest.raises(VerificationError):
+        verify_equivalent(original, parser.parse_str('mes 2\nx = 2\n'))
+
+
+def test_verify_non_terminating(parser):
+    original = parser.parse_str('*a\nmes 1\ngoto *b\n*b\ngoto *a\n')
+    result = optimize(original, verify=True, max_steps=100)
+    assert run_behavior(result.tree, max_steps=100).finished is False
+    with pytest.raises(VerificationError):
+        verify_equivalent(original, parser.parse_str('*a\nmes 2\ngoto *a\n'), max_steps=100)
+
+
+@pytest.mark.parametrize('name', ['call', 'comment', 'hello', 'label', 'op_comp', 'op_mul', 'op_sum'])
+def test_inputs(parser, name):
+    tree = parser.parse_file(INPUTS_DIR / f'{name}.hsp')
+    result = optimize(tree, verify=True)
+    assert result.removed_nodes == tree.size - result.tree.size
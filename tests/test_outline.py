@@ -0,0 +1,96 @@
+import pytest
+from pathlib import Path
+from python3_hsp_tiny_parser.tokenizer import TokenPosition
+from python3_hsp_tiny_parser.parser import Node, Parser
+from python3_hsp_tiny_parser.outline import ASSIGN, COMMAND, LABEL, OutlineEntry, find_label, outline_file, outline_str
+
+
+INPUTS_DIR = Path(__file__).parent.parent / 'inputs'
+
+
+def parser_outline(ast):
+    kinds = {
+        Node.NodeType.LABEL_STMT: LABEL,
+        Node.NodeType.ASSIGN_STMT: ASSIGN,
+        Node.NodeType.CALL_STMT: COMMAND,
+    }
+    return [OutlineEntry(kinds[s.tag], s.child_nodes[0].value.src, s.child_nodes[0].value.pos)
+            for s in ast.child_nodes]
+
+
+def test_outline():
+    src = '*main\n\tx = 1 + 2 ; comment\n\tmes "*notlabel", x\n/* y = 1\n*/ goto *main\n'
+    assert outline_str(src) == [
+        OutlineEntry(LABEL, 'main', TokenPosition(1, 2)),
+        OutlineEntry(ASSIGN, 'x', TokenPosition(2, 2)),
+        OutlineEntry(COMMAND, 'mes', TokenPosition(3, 2)),
+        OutlineEntry(COMMAND, 'goto', TokenPosition(5, 4)),
+    ]
+
+
+def test_directives_are_skipped():
+    assert outline_str('#const N 1\nmes N\n') == [OutlineEntry(COMMAND, 'mes', TokenPosition(2, 1))]
+
+
+def test_conditionals_and_defines():
+    src = '#ifdef DEBUG\n*dbg\nmes 1\n#endif\n#define SHOW mes\nSHOW 2\n'
+    assert outline_str(src) == [OutlineEntry(COMMAND, 'mes', TokenPosition(6, 1))]
+    assert outline_str(src) == parser_outline(Parser(debug=False).parse_str(src))
+
+
+def test_agrees_with_parser_preprocessed():
+    src = ('#define DEBUG\n'
+           '#ifndef DEBUG\n*release\n#else\n*debug\n#endif\n'
+           '#ifdef DEBUG\n#ifdef NONE\nmes 0\n#else\n#define SET x =\n#endif\n#endif\n'
+           '#define L main\n#define EQ =\n#const N 1\n'
+           '*L\nSET N\ny EQ 2\ngoto *L\n')
+    assert outline_str(src) == parser_outline(Parser(debug=False).parse_str(src))
+
+
+def test_command_without_newline():
+    assert outline_str('stop') == [OutlineEntry(COMMAND, 'stop', TokenPosition(1, 1))]
+
+
+@pytest.mark.parametrize('name', ['call', 'comment', 'hello', 'label', 'op_comp', 'op_mul', 'op_sum'])
+def test_agrees_with_parser(name):
+    path = INPUTS_DIR / f'{name}.hsp'
+    assert outline_file(path) == parser_outline(Parser(debug=False).parse_file(path))
+
+
+def test_agrees_with_parser_generated():
+    src = ''.join(f'*l{i}\nv{i} = (v{i} + {i}) * 2 < 3\nmes "a", , v{i}\ngoto *l{i}\n\n' for i in range(50))
+    src += 'x /* c */ = 1\n/* a\n b */ mes "\\";" ; x\n\t* e\n'
+    assert outline_str(src) == parser_outline(Parser(debug=False).parse_str(src))
+
+
+def test_find_label(tmp_path):
+    (tmp_path / 'a.hsp').write_text('mes 1\n*main\nstop\n', encoding='CP932')
+    (tmp_path / 'b.hsp').write_text('*sub\nreturn\n', encoding='CP932')
+    files = sorted(tmp_path.glob('*.hsp'))
+    assert find_label(files, 'main') == [(tmp_path / 'a.hsp', TokenPosition(2, 2))]
+    assert find_label(files, 'none') == []
+
+
+def test_comments_and_strings():
+    src = ('x /* c */ = 1\n'
+           'y == 1\n'
+           'mes "a\\"; *b" ; *c\n'
+           '/* a\n'
+           ' b */ /* c */ *d\n'
+           'mes 1 // x = 1\n'
+           '* e\n')
+    assert outline_str(src) == [
+        OutlineEntry(ASSIGN, 'x', TokenPosition(1, 1)),
+        OutlineEntry(COMMAND, 'y', TokenPosition(2, 1)),
+        OutlineEntry(COMMAND, 'mes', TokenPosition(3, 1)),
+        OutlineEntry(LABEL, 'd', TokenPosition(5, 16)),
+        OutlineEntry(COMMAND, 'mes', TokenPosition(6, 1)),
+        OutlineEntry(LABEL, 'e', TokenPosition(7, 3)),
+    ]
+
+
+def test_crlf():
+    assert outline_str('*a\r\n  mes 1\r\n') == [
+        OutlineEntry(LABEL, 'a', TokenPosition(1, 2)),
+        OutlineEntry(COMMAND, 'mes', TokenPosition(2, 3)),
+    ]
@@ -91,3 +91,50 @@ def test_call_stmt_with_2args(parser):
     assert ast == Stmts(CallStmt(Atom(value=Id(POS, 'x')), Args(
         Atom(value=Int(POS, '1')),
         Atom(value=Int(POS, '2')))))
+
+
+def test_equal_nodes_have_equal_hash():
+    a = AddExpr(Atom(value=Int(POS, '1')), Atom(value=Id(POS, 'x')))
+    b = AddExpr(Atom(value=Int(TokenPosition(2, 3), '1')), Atom(value=Id(POS, 'x')))
+    assert a == b
+    assert hash(a) == hash(b)
+
+
+def test_different_nodes_have_different_hash():
+    a = AddExpr(Atom(value=Int(POS, '1')), Atom(value=Id(POS, 'x')))
+    b = SubExpr(Atom(value=Int(POS, '1')), Atom(value=Id(POS, 'x')))
+    c = AddExpr(Atom(value=Id(POS, 'x')), Atom(value=Int(POS, '1')))
+    assert a != b and hash(a) != hash(b)
+    assert a != c and hash(a) != hash(c)
+
+
+def test_compare_with_non_node():
+    a = Atom(value=Int(POS, '1'))
+    assert a != None
+    assert a != 5
+    assert not (a == 5)
+
+
+def test_node_size():
+    ast = AddExpr(Atom(value=Int(POS, '1')), SubExpr(Atom(value=Int(POS, '2')), Atom(value=Int(POS, '3'))))
+    assert ast.size == 5
+
+
+def test_first_token():
+    pos = TokenPosition(1, 3)
+    ast = CallStmt(Atom(value=Id(POS, 'x')), Args(Node.Default(), Atom(value=Int(pos, '1'))))
+    assert ast.child_nodes[1].first_token().pos == pos
+    assert Args(Node.Default()).first_token() is None
+
+
+def test_paren_expr(parser):
+    ast = parser.parse_str('x = (1 + 2) * 3\n')
+    assert ast == Stmts(AssignStmt(Atom(value=Id(POS, 'x')), Node.MulExpr(
+        AddExpr(Atom(value=Int(POS, '1')), Atom(value=Int(POS, '2'))),
+        Atom(value=Int(POS, '3')))))
+
+
+@pytest.mark.parametrize('src', ['x = (1 + 2\n', 'x = ()\n', 'x = "(" 1)\n'])
+def test_invalid_paren_expr(parser, src):
+    with pytest.raises(ParseError):
+        parser.parse_str(src)
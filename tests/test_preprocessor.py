@@ -0,0 +1,195 @@
+import os
+import re
+import pytest
+from python3_hsp_tiny_parser.tokenizer import TokenPosition, Token, Tokenizer
+from python3_hsp_tiny_parser.preprocessor import IncludeCache, PreprocessError, Preprocessor
+from python3_hsp_tiny_parser.parser import Node, Parser
+
+
+Id = Token.Id
+Int = Token.Int
+
+Stmts = Node.Stmts
+AssignStmt = Node.AssignStmt
+CallStmt = Node.CallStmt
+Args = Node.Args
+Atom = Node.Atom
+
+POS = TokenPosition(1, 1)
+
+
+@pytest.fixture
+def pp():
+    return Preprocessor()
+
+
+def preprocess(pp, src, basedir='.'):
+    return pp.preprocess_tokens(Tokenizer().tokenize(src), basedir)
+
+
+def write(path, src):
+    path.write_text(src, encoding='CP932')
+    return path
+
+
+def touch(path, src):
+    # mtimeの分解能に依存しないように、更新時刻を明示的に進める
+    st = os.stat(path)
+    write(path, src)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_no_directives(pp):
+    tokens = preprocess(pp, 'x = 1\n')
+    assert tokens == Tokenizer().tokenize('x = 1\n')
+
+
+def test_const_is_folded(pp):
+    tokens = preprocess(pp, '#const N 1 + 2 * 3\nx = N\n')
+    assert tokens == Tokenizer().tokenize('x = 7\n')
+
+
+def test_const_refers_to_const(pp):
+    tokens = preprocess(pp, '#const A 7\n#const B A \\ 4\nx = B\n')
+    assert tokens == Tokenizer().tokenize('x = 3\n')
+
+
+@pytest.mark.parametrize('src', ['#const N x\n', '#const N 1 / 0\n', '#const N 1 - 2\n'])
+def test_invalid_const(pp, src):
+    with pytest.raises(PreprocessError):
+        preprocess(pp, src)
+
+
+def test_define(pp):
+    tokens = preprocess(pp, '#define GREETING "hello"\nmes GREETING\n')
+    assert tokens == Tokenizer().tokenize('mes "hello"\n')
+
+
+@pytest.mark.parametrize('src, expected', [
+    ('#define A\n#ifdef A\nx = 1\n#else\nx = 2\n#endif\n', 'x = 1\n'),
+    ('#ifdef A\nx = 1\n#else\nx = 2\n#endif\n', 'x = 2\n'),
+    ('#ifndef A\nx = 1\n#endif\n', 'x = 1\n'),
+])
+def test_conditional(pp, src, expected):
+    assert preprocess(pp, src) == Tokenizer().tokenize(expected)
+
+
+@pytest.mark.parametrize('src', ['#module m\n', '#unknown\n', '#endif\n', '#ifdef A\n'])
+def test_invalid_directive(pp, src):
+    with pytest.raises(PreprocessError):
+        preprocess(pp, src)
+
+
+def test_include(pp, tmp_path):
+    write(tmp_path / 'common.as', '#const N 3\nmes N')
+    main = write(tmp_path / 'main.hsp', '#include "common.as"\nx = N\n')
+    assert pp.preprocess_file(main) == Tokenizer().tokenize('mes 3\nx = 3\n')
+
+
+def test_include_not_found(pp, tmp_path):
+    main = write(tmp_path / 'main.hsp', '#include "missing.as"\n')
+    with pytest.raises(PreprocessError):
+        pp.preprocess_file(main)
+
+
+def test_recursive_include(pp, tmp_path):
+    write(tmp_path / 'a.as', '#include "b.as"\n')
+    write(tmp_path / 'b.as', '#include "a.as"\n')
+    main = write(tmp_path / 'main.hsp', '#include "a.as"\n')
+    with pytest.raises(PreprocessError):
+        pp.preprocess_file(main)
+
+
+def test_include_guard(pp, tmp_path):
+    write(tmp_path / 'common.as', '#ifndef COMMON\n#define COMMON\nmes 1\n#endif\n')
+    main = write(tmp_path / 'main.hsp', '#include "common.as"\n#include "common.as"\n')
+    assert pp.preprocess_file(main) == Tokenizer().tokenize('mes 1\n')
+    assert pp.cache.entry((tmp_path / 'common.as').resolve()).guard == 'COMMON'
+
+
+def test_ifndef_with_else_is_not_a_guard(pp, tmp_path):
+    write(tmp_path / 'common.as', '#ifndef COMMON\n#define COMMON\nmes 1\n#else\nmes 2\n#endif\n')
+    main = write(tmp_path / 'main.hsp', '#include "common.as"\n#include "common.as"\n')
+    assert pp.preprocess_file(main) == Tokenizer().tokenize('mes 1\nmes 2\n')
+    assert pp.cache.entry((tmp_path / 'common.as').resolve()).guard is None
+
+
+def test_included_tokens_carry_srcfile(pp, tmp_path):
+    common = write(tmp_path / 'common.as', '#define M mes\nz = 1\n')
+    main = write(tmp_path / 'main.hsp', 'x = 1\n#include "common.as"\nM x\n')
+    tokens = pp.preprocess_file(main)
+    assert [(t.src, t.pos) for t in tokens if t.tag == Token.TokenType.ID] == [
+        ('x', TokenPosition(1, 1)),
+        ('z', TokenPosition(2, 1, common.resolve())),
+        ('mes', TokenPosition(3, 1)),
+        ('x', TokenPosition(3, 3)),
+    ]
+
+
+@pytest.mark.parametrize('src', ['#foo\n', 'x = 0\'\n'])
+def test_error_in_included_file_reports_its_path(pp, tmp_path, src):
+    common = write(tmp_path / 'common.as', src)
+    main = write(tmp_path / 'main.hsp', '#include "common.as"\n')
+    with pytest.raises(Exception, match=re.escape(f'{common.resolve()} row:1 column:')):
+        pp.preprocess_file(main)
+
+
+def test_included_tokens_are_cached(pp, tmp_path):
+    common = write(tmp_path / 'common.as', 'mes 1\n')
+    a = write(tmp_path / 'a.hsp', '#include "common.as"\n')
+    b = write(tmp_path / 'b.hsp', '#include "common.as"\n')
+    pp.preprocess_file(a)
+    entry = pp.cache.entry(common.resolve())
+    pp.preprocess_file(b)
+    assert pp.cache.entry(common.resolve()) is entry
+
+
+def test_changed_header_invalidates_only_dependents(pp, tmp_path):
+    common = write(tmp_path / 'common.as', '#const N 1\n')
+    a = write(tmp_path / 'a.hsp', '#include "common.as"\nx = N\n')
+    b = write(tmp_path / 'b.hsp', 'y = 1\n')
+    tokens_a = pp.preprocess_file(a)
+    tokens_b = pp.preprocess_file(b)
+
+    touch(common, '#const N 2\n')
+
+    assert pp.cache.dependents(common.resolve()) == {a.resolve()}
+    assert pp.preprocess_file(b) is tokens_b
+    assert pp.preprocess_file(a) is not tokens_a
+    assert pp.preprocess_file(a) == Tokenizer().tokenize('x = 2\n')
+
+
+def test_expansion_from_old_header_is_not_stored(tmp_path):
+    # 古いヘッダで展開したスレッドの保存が、新しいヘッダで展開したスレッドの保存より後になる場合
+    common = write(tmp_path / 'common.as', '#const N 1\n')
+    main = write(tmp_path / 'main.hsp', '#include "common.as"\nx = N\n')
+
+    class RacingCache(IncludeCache):
+        raced = False
+
+        def set_expanded(self, path, tokens, mtimes):
+            if not self.raced:
+                self.raced = True
+                touch(common, '#const N 2\n')
+                assert pp.preprocess_file(main) == Tokenizer().tokenize('x = 2\n')
+            super().set_expanded(path, tokens, mtimes)
+
+    pp = Preprocessor(RacingCache())
+    assert pp.preprocess_file(main) == Tokenizer().tokenize('x = 1\n')
+    assert pp.preprocess_file(main) == Tokenizer().tokenize('x = 2\n')
+
+
+def test_include_dirs(tmp_path):
+    (tmp_path / 'lib').mkdir()
+    write(tmp_path / 'lib' / 'common.as', 'mes 1\n')
+    main = write(tmp_path / 'main.hsp', '#include "common.as"\n')
+    pp = Preprocessor(IncludeCache(include_dirs=[tmp_path / 'lib']))
+    assert pp.preprocess_file(main) == Tokenizer().tokenize('mes 1\n')
+
+
+def test_parse_file_with_preprocessor(tmp_path):
+    main = write(tmp_path / 'main.hsp', '#const N 2\nx = N\nmes x\n')
+    ast = Parser().parse_file(main)
+    assert ast == Stmts(
+        AssignStmt(Atom(value=Id(POS, 'x')), Atom(value=Int(POS, '2'))),
+        CallStmt(Atom(value=Id(POS, 'mes')), Args(Atom(value=Id(POS, 'x')))))
@@ -0,0 +1,85 @@
+import pytest
+from python3_hsp_tiny_parser.tokenizer import TokenPosition
+from python3_hsp_tiny_parser.parser import Node, Parser
+from python3_hsp_tiny_parser.query import ANY, REST, Pattern, Q, Tok, QueryError, TreeIndex, find, parse_query, run_batch
+
+
+SRC = '''*main
+mes "hello"
+mes x
+mes "a", 1
+x = 1 == 2
+y = a < 3 + b
+goto *main
+'''
+
+
+@pytest.fixture
+def ast():
+    return Parser(debug=False).parse_str(SRC)
+
+
+def test_find_by_tag(ast):
+    assert len(find(ast, Q('Call'))) == 4
+    assert len(find(ast, Q(Node.NodeType.ASSIGN_STMT))) == 2
+
+
+def test_find_by_child_pattern(ast):
+    pattern = Q('Call', Tok('ID', 'mes'), Q('Args', Tok('STR'), REST))
+    nodes = find(ast, pattern)
+    assert [n.first_token().pos for n in nodes] == [TokenPosition(2, 1), TokenPosition(4, 1)]
+
+
+def test_exact_children(ast):
+    pattern = Q('Call', Tok('ID', 'mes'), Q('Args', Tok('STR')))
+    assert len(find(ast, pattern)) == 1
+
+
+def test_multiple_tags_keep_tree_order(ast):
+    pattern = Q(['==', '<'], ANY, ANY)
+    assert [n.tag for n in find(ast, pattern)] == [Node.NodeType.EQ_EXPR, Node.NodeType.LT_EXPR]
+
+
+@pytest.mark.parametrize('query, count', [
+    ('(Call ID:mes (Args STR ...))', 2),
+    ('(Call ID:mes (Args STR))', 1),
+    ('(Call ID:mes ...)', 3),
+    ('(==|!=|<|<=|>|>= _ INT)', 1),
+    ('(==|!=|<|<=|>|>= INT INT)', 1),
+    ('(_ ID (+ ...))', 1),
+    ('(Call _ (Args LabelLiteral))', 1),
+    ('(Call _ (Args STR:"hello"))', 1),
+    ('INT', 4),
+    ('+', 1),
+])
+def test_query_string(ast, query, count):
+    assert len(find(ast, query)) == count
+
+
+@pytest.mark.parametrize('query', ['(', '(Call', ')', '(Unknown)', '(Call ... _)', '...', 'INT INT'])
+def test_invalid_query(query):
+    with pytest.raises(QueryError):
+        parse_query(query)
+
+
+def test_index_touches_only_candidates(ast):
+    index = TreeIndex(ast)
+    assert all(n.tag == Node.NodeType.CALL_STMT for n in index.candidates(Q('Call')))
+    assert len(list(index.candidates(Q('Call')))) == 4
+
+
+def test_run_batch(tmp_path):
+    a = tmp_path / 'a.hsp'
+    b = tmp_path / 'b.hsp'
+    a.write_text('mes "a"\nx = 1 / 0\n', encoding='CP932')
+    b.write_text('\nmes "b"\n', encoding='CP932')
+    results = run_batch({
+        'mes_str': '(Call ID:mes (Args STR ...))',
+        'div_zero': Q(['/', '\\'], ANY, Tok('INT', '0')),
+    }, [a, b])
+    assert [(m.srcfile, m.pos) for m in results['mes_str']] == [(a, TokenPosition(1, 1)), (b, TokenPosition(2, 1))]
+    assert [(m.srcfile, m.pos) for m in results['div_zero']] == [(a, TokenPosition(2, 5))]
+
+
+def test_base_pattern_matches_nothing(ast):
+    assert TreeIndex(ast).find(Pattern()) == []
@@ -118,3 +118,47 @@ def test_multiple_newlines_are_deduped(tok, src):
 def test_invalid_newline(tok, src):
     with pytest.raises(TokenizeError) as e:
         __ = tok.tokenize(src)
+
+
+def test_str_position(tok):
+    tokens = tok.tokenize('x "str"')
+    assert tokens[1].pos == TokenPosition(1, 3)
+
+
+def test_iter_tokens(tok):
+    src = 'x = 1\n\nmes "a"\n'
+    assert list(tok.iter_tokens(src)) == tok.tokenize(src)
+
+
+@pytest.mark.parametrize("src", [
+    'x = 1\n\nmes "a"\n',
+    'x = 1 /* a\n\nb */ mes "c\nd"\r\ny\n',
+    'mes 1\n/* unclosed\n',
+    'mes "unclosed\n\n',
+    'mes 1\n@\n',
+    '',
+])
+def test_iter_lines(tok, src):
+    def tokens(it):
+        result = []
+        try:
+            for t in it:
+                result.append((t.tag, t.src, t.pos))
+        except TokenizeError as e:
+            result.append(str(e))
+        return result
+
+    assert tokens(tok.iter_lines(src.splitlines(keepends=True))) == tokens(tok.iter_tokens(src))
+
+
+def test_iter_lines_is_lazy(tok):
+    consumed = []
+
+    def lines():
+        for i in range(1000):
+            consumed.append(i)
+            yield f'x{i} = {i}\n'
+
+    tokens = tok.iter_lines(lines())
+    assert [next(tokens).src for __ in range(4)] == ['x0', '=', '0', '<LF>']
+    assert len(consumed) == 1
@@ -0,0 +1,129 @@
+import io
+import os
+import ast
+import pytest
+from python3_hsp_tiny_parser.parser import Parser
+from python3_hsp_tiny_parser.transpile import CodeCache, ExecutionLimitError, Label, TranspileError, \
+    compile_str, compile_tree, to_python_ast, to_python_source
+
+
+def run(src, **kwargs):
+    out = io.StringIO()
+    variables = compile_str(src, cache=CodeCache()).run(stdout=out, **kwargs)
+    return out.getvalue(), variables
+
+
+def test_arithmetic():
+    out, variables = run('a = 7 / 2\nb = (0 - 7) / 2\nc = (0 - 7) \\ 2\nd = 7 \\ (0 - 2)\n'
+                         'e = 1 + 2 * 3 - 4\nmes a < b\nmes a >= 3\n')
+    assert out == '0\n1\n'
+    assert variables == {'a': 3, 'b': -3, 'c': -1, 'd': 1, 'e': 3}
+
+
+def test_strings():
+    out, variables = run('s = "a\\tb"\ns = s + 1\nt = "1" + 2\nn = 3 + "4x"\nmes s\nmes s == "a\\tb1"\n')
+    assert out == 'a\tb1\n1\n'
+    assert variables['t'] == '12' and variables['n'] == 7
+
+
+def test_uninitialized_variable_is_zero():
+    assert run('mes x + 1\n') == ('1\n', {'x': 0})
+
+
+def test_goto_and_gosub():
+    src = ('*main\n'
+           'gosub *sub\n'
+           'gosub *sub\n'
+           'l = *fin\n'
+           'goto l\n'
+           'mes "dead"\n'
+           '*sub\n'
+           'i = i + 1\n'
+           'mes i\n'
+           'return\n'
+           '*fin\n'
+           'end\n'
+           'mes "dead"\n')
+    out, variables = run(src)
+    assert out == '1\n2\n'
+    assert variables['i'] == 2
+    assert variables['l'] == Label('fin')
+
+    with pytest.raises(RuntimeError):
+        run('l = 1\ngoto l\n')
+
+
+def test_commands():
+    calls = []
+    program = compile_str('foo 1, , "a" + 2\nfoo\n', cache=CodeCache())
+    program.run(commands={'foo': lambda *args: calls.append(args)})
+    assert calls == [(1, None, 'a2'), ()]
+
+    with pytest.raises(TranspileError):
+        program.run()
+
+
+def test_max_steps():
+    src = '*loop\ni = i + 1\ngoto *loop\n'
+    with pytest.raises(ExecutionLimitError):
+        run(src, max_steps=100)
+    assert run('mes 1\n', max_steps=1) == ('1\n', {})
+
+
+def test_errors():
+    with pytest.raises(TranspileError):
+        to_python_source(Parser(debug=False).parse_str('goto *none\n'))
+    with pytest.raises(TranspileError):
+        to_python_source(Parser(debug=False).parse_str('goto\n'))
+    with pytest.raises(RuntimeError):
+        run('return\n')
+
+
+def test_python_ast():
+    tree = to_python_ast(Parser(debug=False).parse_str('*a\nx = 1\ngoto *b\n*b\nend\n'))
+    assert isinstance(tree, ast.Module)
+    compile(tree, '<hsp>', 'exec')
+
+
+def test_int_variables_are_inlined():
+    source = to_python_source(Parser(debug=False).parse_str('i = 0\ni = i + 1\ns = "a"\ns = s + i\n'))
+    assert 'v_i = (v_i + 1)' in source
+    assert 'v_s = _add(v_s, v_i)' in source
+
+
+def test_cache():
+    cache = CodeCache()
+    parser = Parser(debug=False)
+    p1 = compile_str('mes 1\n', cache=cache)
+    assert compile_str('mes 1\n', cache=cache) is p1
+    assert compile_tree(parser.parse_str('\nmes 1 ; same\n'), cache=cache) is p1
+    assert compile_str('mes 2\n', cache=cache) is not p1
+    assert len(cache) == 4
+
+
+def test_cache_is_bounded():
+    cache = CodeCache(maxsize=2)
+    p1 = compile_str('mes 1\n', cache=cache)
+    assert len(cache) == 2
+    compile_str('mes 2\n', cache=cache)
+    assert len(cache) == 2
+    assert compile_str('mes 1\n', cache=cache) is not p1
+
+
+def test_cache_with_include(tmp_path):
+    header = tmp_path / 'h.as'
+    header.write_text('#const N 1\n', encoding='CP932')
+    src = f'#include "{header.as_posix()}"\nmes N\n'
+    cache = CodeCache()
+    out = io.StringIO()
+    compile_str(src, cache=cache).run(stdout=out)
+
+    st = os.stat(header)
+    header.write_text('#const N 2\n', encoding='CP932')
+    os.utime(header, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    compile_str(src, cache=cache).run(stdout=out)
+    assert out.getvalue() == '1\n2\n'
+
+
+def test_empty():
+    assert run('') == ('', {})
@@ -0,0 +1,156 @@
+import os
+import pytest
+from python3_hsp_tiny_parser.lint import PARSE_ERROR_RULE
+from python3_hsp_tiny_parser.watch import Watcher
+
+
+def write(path, src):
+    # mtimeの分解能に依存しないように、更新時刻を明示的に進める
+    mtime_ns = os.stat(path).st_mtime_ns if path.exists() else None
+    path.write_text(src, encoding='CP932')
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns + 1_000_000_000))
+    return path.resolve()
+
+
+@pytest.fixture
+def project(tmp_path):
+    write(tmp_path / 'a.hsp', 'x = 1 / 0\nmes x\n')
+    write(tmp_path / 'b.hsp', 'mes 1\n')
+    (tmp_path / 'sub').mkdir()
+    write(tmp_path / 'sub' / 'c.hsp', '#include "../common.as"\nmes N\n')
+    write(tmp_path / 'common.as', '#const N 1\n')
+    write(tmp_path / 'notes.txt', 'ignored\n')
+    return tmp_path
+
+
+def test_initial_poll_reports_everything(project):
+    watcher = Watcher([project])
+    new, resolved = watcher.poll()
+    assert [d.rule for d in new] == ['division-by-zero']
+    assert resolved == []
+    assert len(watcher.asts) == 3
+
+
+def test_no_change_reparses_nothing(project):
+    watcher = Watcher([project])
+    watcher.poll()
+    asts = dict(watcher.asts)
+    assert watcher.scan() == set()
+    assert watcher.poll() == ([], [])
+    assert all(watcher.asts[p] is asts[p] for p in asts)
+
+
+def test_only_changed_file_is_reparsed(project):
+    watcher = Watcher([project])
+    watcher.poll()
+    b = (project / 'b.hsp').resolve()
+    ast_b = watcher.asts[b]
+
+    a = write(project / 'a.hsp', 'x = 1 / 2\nmes x\n')
+    new, resolved = watcher.poll()
+    assert new == []
+    assert [(d.srcfile, d.rule) for d in resolved] == [(a, 'division-by-zero')]
+    assert watcher.asts[b] is ast_b
+
+
+def test_rewrite_with_same_mtime_is_reparsed(project):
+    watcher = Watcher([project])
+    watcher.poll()
+    b = (project / 'b.hsp').resolve()
+    st = os.stat(b)
+
+    # サイズは変わるがmtimeは変わらない書き換え (mtimeの分解能が粗い場合や、同じ時刻内の編集)
+    b.write_text('x = 1 / 0\nmes x\n', encoding='CP932')
+    os.utime(b, ns=(st.st_atime_ns, st.st_mtime_ns))
+    new, resolved = watcher.poll()
+    assert [(d.srcfile, d.rule) for d in new] == [(b, 'division-by-zero')]
+    assert resolved == []
+
+
+def test_parse_error_is_reported_and_resolved(project):
+    watcher = Watcher([project])
+    watcher.poll()
+    b = write(project / 'b.hsp', 'mes (\n')
+    new, resolved = watcher.poll()
+    assert [(d.srcfile, d.rule) for d in new] == [(b, PARSE_ERROR_RULE)]
+    assert b not in watcher.asts
+
+    write(project / 'b.hsp', 'mes 1\n')
+    new, resolved = watcher.poll()
+    assert new == []
+    assert [(d.srcfile, d.rule) for d in resolved] == [(b, PARSE_ERROR_RULE)]
+
+
+def test_undecodable_file_is_reported(project):
+    watcher = Watcher([project])
+    watcher.poll()
+    b = project / 'b.hsp'
+    st = os.stat(b)
+    b.write_bytes(b'mes \x82\n')
+    os.utime(b, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    new, resolved = watcher.poll()
+    assert [(d.srcfile, d.rule) for d in new] == [(b.resolve(), PARSE_ERROR_RULE)]
+    assert 'UnicodeDecodeError' in new[0].message
+
+
+def test_file_removed_after_scan_is_reported(project):
+    watcher = Watcher([project])
+    watcher.poll()
+    b = write(project / 'b.hsp', 'mes 2\n')
+    changed = watcher.scan()
+    b.unlink()
+    new, resolved = watcher.update(changed)
+    assert [(d.srcfile, d.rule) for d in new] == [(b, PARSE_ERROR_RULE)]
+    assert 'FileNotFoundError' in new[0].message
+
+    new, resolved = watcher.poll()
+    assert new == []
+    assert [d.rule for d in resolved] == [PARSE_ERROR_RULE]
+
+
+def test_changed_header_reparses_dependents(project):
+    reports = []
+    watcher = Watcher([project], report=lambda new, resolved: reports.append((new, resolved)))
+    watcher.poll()
+    c = (project / 'sub' / 'c.hsp').resolve()
+    a = (project / 'a.hsp').resolve()
+    ast_a = watcher.asts[a]
+
+    write(project / 'common.as', '#const N 1 / 0\n')
+    new, resolved = watcher.poll()
+    assert [(d.srcfile, d.rule) for d in new] == [(c, PARSE_ERROR_RULE)]
+    assert watcher.asts[a] is ast_a
+    assert reports[-1] == (new, resolved)
+
+
+def test_intermediate_header_is_not_parsed(project):
+    write(project / 'common.as', '#include "inner.as"\n')
+    write(project / 'inner.as', '#const N 1\n')
+    watcher = Watcher([project])
+    watcher.poll()
+    c = (project / 'sub' / 'c.hsp').resolve()
+
+    write(project / 'inner.as', '#const N 1\nz = 1\n')
+    new, resolved = watcher.poll()
+    assert [(d.srcfile, d.rule) for d in new] == [(c, 'unused-variable')]
+    assert (project / 'common.as').resolve() not in watcher.asts
+    assert (project / 'common.as').resolve() not in watcher.diagnostics
+
+
+def test_removed_file_resolves_diagnostics(project):
+    watcher = Watcher([project])
+    watcher.poll()
+    (project / 'a.hsp').unlink()
+    new, resolved = watcher.poll()
+    assert new == []
+    assert [d.rule for d in resolved] == ['division-by-zero']
+    assert len(watcher.asts) == 2
+
+
+def test_run_debounces(project, monkeypatch):
+    watcher = Watcher([project])
+    sleeps = []
+    monkeypatch.setattr('time.sleep', lambda sec: sleeps.append(sec))
+    watcher.run(interval=1.0, debounce=0.1, max_polls=3)
+    assert sleeps == [1.0, 1.0, 1.0]